@@ -0,0 +1,18 @@
+import os
+import sys
+
+APP_NAME = "RandomVideoJoiner"
+
+
+def get_app_data_dir():
+    """Return (and create) the per-user data folder used for caches and state"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.environ.get('APPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+
+    path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import threading
+
+from render_scheduler import RenderJob
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def partial_path(output_file, tag=None):
+    """Name an output is rendered under until it is complete ("x.part.mp4" for "x.mp4",
+    "x.part.<tag>.mp4" when several renderers may attempt the same output)"""
+    root, ext = os.path.splitext(output_file)
+    return root + ".part" + (f".{tag}" if tag else "") + ext
+
+
+class BatchManifest:
+    """Checkpoint of a batch: its settings and every output's planned clips and status.
+
+    Rewritten atomically whenever an output changes state, so a crashed or
+    cancelled batch can be resumed with exactly the same plans.
+    """
+
+    def __init__(self, path, settings=None, outputs=None, created=None):
+        self.path = path
+        self.settings = settings or {}
+        self.outputs = outputs or []   # dicts: index, output_file, clips, sources, duration, status
+        self.created = created or time.time()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, settings, jobs):
+        outputs = [{
+            'index': job.index,
+            'output_file': job.output_file,
+            'clips': list(job.clips),
+            'sources': list(job.sources),
+            'duration': job.duration,
+            'status': 'pending',
+        } for job in jobs]
+        manifest = cls(path, settings, outputs)
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version in {path}")
+        return cls(path, data.get('settings'), data.get('outputs'), data.get('created'))
+
+    def save(self):
+        with self.lock:
+            data = {
+                'version': MANIFEST_VERSION,
+                'created': self.created,
+                'updated': time.time(),
+                'settings': self.settings,
+                'outputs': self.outputs,
+            }
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+
+    def mark(self, index, status):
+        with self.lock:
+            for output in self.outputs:
+                if output['index'] == index:
+                    output['status'] = status
+                    break
+        self.save()
+
+    def is_finished(self, output):
+        # A "done" output whose file has since disappeared is rendered again
+        return output['status'] == 'done' and os.path.exists(output['output_file'])
+
+    def pending_jobs(self):
+        """RenderJobs for the outputs that still have to be rendered"""
+        with self.lock:
+            return [RenderJob(o['index'], o['output_file'], o['clips'], o['duration'], o.get('sources'))
+                    for o in self.outputs if not self.is_finished(o)]
+
+    def counts(self):
+        with self.lock:
+            done = sum(1 for o in self.outputs if self.is_finished(o))
+            return done, len(self.outputs)
@@ -0,0 +1,269 @@
+"""
+Benchmark harness for the scan, probe, plan and concat paths.
+
+Generates a synthetic clip corpus offline with ffmpeg's lavfi sources
+(testsrc + sine), times each stage and writes the results as JSON so runs
+can be compared:
+
+    python benchmark.py --corpus bench_corpus --clips 200 --out results.json
+    python benchmark.py --corpus bench_corpus --out new.json --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from library_scanner import iter_video_files
+from probe_cache import ProbeCache
+from probe_engine import ProbeEngine
+from video_manager import VideoManager
+from selection_planner import plan_batch
+from joiner_engine import VideoJoiner
+
+# ffmpeg encoder per codec name accepted by --codecs
+ENCODERS = {
+    'h264': ['-c:v', 'libx264', '-preset', 'ultrafast'],
+    'hevc': ['-c:v', 'libx265', '-preset', 'ultrafast'],
+    'mpeg4': ['-c:v', 'mpeg4'],
+}
+
+# Metrics where a larger value is better; everything else is a duration
+HIGHER_IS_BETTER = ('files_per_sec', 'mb_per_sec', 'realtime_factor', 'clips_per_sec')
+
+
+def generate_corpus(corpus_dir, clips, min_duration, max_duration, codecs, size, fps, seed):
+    """Create missing synthetic clips. Existing ones are reused so reruns are cheap."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(seed)
+    created = 0
+    for i in range(clips):
+        codec = codecs[i % len(codecs)]
+        duration = round(rng.uniform(min_duration, max_duration), 2)
+        path = os.path.join(corpus_dir, f"clip_{i:05d}_{codec}.mp4")
+        if os.path.exists(path):
+            continue
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-f', 'lavfi', '-i', f"testsrc=size={size}:rate={fps}:duration={duration}",
+            '-f', 'lavfi', '-i', f"sine=frequency={220 + (i % 8) * 110}:duration={duration}",
+            *ENCODERS[codec],
+            '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-shortest',
+            '-y', path,
+        ]
+        subprocess.run(cmd, check=True)
+        created += 1
+    return created
+
+
+def bench_scan(corpus_dir, repeat):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_video_files(corpus_dir, ('.mp4',), recursive=True))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'files': count, 'seconds': best, 'files_per_sec': count / best if best else 0}
+
+
+def bench_probe(corpus_dir, work_dir):
+    """Cold probe (empty cache), warm probe (cache hit) and ffprobe-only throughput"""
+    results = {}
+    db_path = os.path.join(work_dir, "probe_cache.sqlite3")
+
+    for label in ('cold', 'warm'):
+        manager = VideoManager(probe_cache=ProbeCache(db_path), persist_cycle=False)
+        start = time.perf_counter()
+        count = manager.load_videos(corpus_dir, recursive=True)
+        elapsed = time.perf_counter() - start
+        results[label] = {'files': count, 'seconds': elapsed, 'files_per_sec': count / elapsed if elapsed else 0}
+        manager.probe_cache.close()
+
+    # ffprobe for every file (through the same concurrent engine), to see what the native parser saves
+    files = [p for p, _ in iter_video_files(corpus_dir, ('.mp4',), recursive=True)]
+    start = time.perf_counter()
+    probed = ProbeEngine(native=False).probe_many(files)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for result in probed.values() if not result.ok)
+    results['ffprobe'] = {'files': len(files), 'failed': failed, 'seconds': elapsed,
+                          'files_per_sec': len(files) / elapsed if elapsed else 0}
+    return results
+
+
+def bench_plan(work_dir, clips, outputs, target_sec, seed):
+    """Plan a batch over an in-memory synthetic library (no files needed)"""
+    rng = random.Random(seed)
+    manager = VideoManager(probe_cache=ProbeCache(os.path.join(work_dir, "plan.sqlite3")), persist_cycle=False)
+    for i in range(clips):
+        manager.library.add(f"/synthetic/clip_{i}.mp4", rng.uniform(5, 60), 'h264' if i % 10 else 'hevc')
+
+    start = time.perf_counter()
+    plan = plan_batch(manager, target_sec, outputs)
+    elapsed = time.perf_counter() - start
+    planned = sum(len(o.clips) for o in plan.outputs)
+    return {
+        'library_clips': clips,
+        'outputs': len(plan.outputs),
+        'seconds': elapsed,
+        'clips_per_sec': planned / elapsed if elapsed else 0,
+        'within_tolerance': sum(1 for o in plan.outputs if o.within_tolerance),
+    }
+
+
+def bench_concat(corpus_dir, work_dir, target_sec):
+    manager = VideoManager(probe_cache=ProbeCache(os.path.join(work_dir, "probe_cache.sqlite3")), persist_cycle=False)
+    manager.load_videos(corpus_dir, recursive=True)
+    out_dir = os.path.join(work_dir, "concat_out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    joiner = VideoJoiner(manager, target_sec, False, out_dir, 1, max_jobs=1, on_log=lambda message: None)
+    jobs = joiner.plan_jobs()
+    if not jobs:
+        return {'error': "nothing to concat"}
+    job = jobs[0]
+
+    bytes_in = sum(os.path.getsize(c) for c in job.clips)
+    start = time.perf_counter()
+    ok = joiner.render_job(job)
+    elapsed = time.perf_counter() - start
+    bytes_out = os.path.getsize(job.output_file) if os.path.exists(job.output_file) else 0
+    return {
+        'ok': ok,
+        'clips': len(job.clips),
+        'media_seconds': job.duration,
+        'seconds': elapsed,
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+        'mb_per_sec': bytes_out / 1024 ** 2 / elapsed if elapsed else 0,
+        'realtime_factor': job.duration / elapsed if elapsed else 0,
+    }
+
+
+def environment():
+    commit = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        pass
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+    }
+
+
+def _flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, threshold):
+    """Print metric changes vs a baseline. Returns the list of regressed metric names."""
+    cur = _flatten(current.get('results', {}))
+    base = _flatten(baseline.get('results', {}))
+    regressions = []
+    for name in sorted(cur):
+        if name not in base or not base[name]:
+            continue
+        leaf = name.rsplit('.', 1)[-1]
+        if leaf not in HIGHER_IS_BETTER and leaf != 'seconds':
+            continue
+        change = (cur[name] - base[name]) / base[name]
+        worse = change < -threshold if leaf in HIGHER_IS_BETTER else change > threshold
+        marker = "  REGRESSION" if worse else ""
+        print(f"{name:40s} {base[name]:14.3f} -> {cur[name]:14.3f} ({change:+.1%}){marker}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scan/probe/plan/concat")
+    parser.add_argument('--corpus', default='bench_corpus', help="Folder for the synthetic clips")
+    parser.add_argument('--clips', type=int, default=100)
+    parser.add_argument('--min-duration', type=float, default=2.0)
+    parser.add_argument('--max-duration', type=float, default=10.0)
+    parser.add_argument('--codecs', default='h264', help="Comma separated: " + ", ".join(ENCODERS))
+    parser.add_argument('--size', default='640x360')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--plan-clips', type=int, default=100000, help="Synthetic library size for planning")
+    parser.add_argument('--plan-outputs', type=int, default=100)
+    parser.add_argument('--target', type=float, default=60.0, help="Target seconds per output")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip', default='', help="Comma separated stages to skip: scan,probe,plan,concat")
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', help="Baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change counted as regression")
+    args = parser.parse_args(argv)
+
+    codecs = [c.strip() for c in args.codecs.split(',') if c.strip()]
+    unknown = [c for c in codecs if c not in ENCODERS]
+    if unknown:
+        parser.error(f"unknown codec(s): {', '.join(unknown)}")
+    skip = {s.strip() for s in args.skip.split(',') if s.strip()}
+    needs_files = not {'scan', 'probe', 'concat'} <= skip
+    if needs_files and not shutil.which('ffmpeg'):
+        print("ffmpeg not found in PATH; only the plan stage can run (use --skip scan,probe,concat)")
+        return 2
+
+    results = {}
+    if needs_files:
+        print(f"Preparing corpus in {args.corpus}...")
+        created = generate_corpus(args.corpus, args.clips, args.min_duration, args.max_duration,
+                                  codecs, args.size, args.fps, args.seed)
+        print(f"  {created} clip(s) generated")
+
+    with tempfile.TemporaryDirectory(prefix="rvj_bench_") as work_dir:
+        if 'scan' not in skip:
+            print("Scan...")
+            results['scan'] = bench_scan(args.corpus, args.repeat)
+        if 'probe' not in skip:
+            print("Probe...")
+            results['probe'] = bench_probe(args.corpus, work_dir)
+        if 'plan' not in skip:
+            print("Plan...")
+            results['plan'] = bench_plan(work_dir, args.plan_clips, args.plan_outputs, args.target, args.seed)
+        if 'concat' not in skip:
+            print("Concat...")
+            results['concat'] = bench_concat(args.corpus, work_dir, args.target)
+
+    report = {
+        'environment': environment(),
+        'config': vars(args),
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
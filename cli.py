@@ -0,0 +1,414 @@
+"""
+Headless batch entry point (no Qt required).
+
+Usage:
+    python cli.py run batch.json
+    python cli.py resume Output/batch_1700000000.manifest.json   (after a crash or Ctrl+C)
+    python cli.py estimate batch.json   (predicted sizes and run time; renders nothing)
+    python cli.py prune-cache --max-age-days 90   (forget probes of deleted or old files)
+
+    # Spread the outputs over several machines sharing a NAS:
+    python cli.py enqueue batch.json --queue /nas/render_queue.sqlite3
+    python cli.py worker --queue /nas/render_queue.sqlite3     (on every node)
+    python cli.py status --queue /nas/render_queue.sqlite3
+
+A batch spec is JSON (or YAML if PyYAML is installed). Top-level keys are
+defaults for every entry in "batches"; a spec without "batches" is a single
+batch:
+
+    {
+        "output_dir": "/renders/out",
+        "mute": false,
+        "max_jobs": 4,
+        "metrics_file": "/renders/metrics.jsonl",
+        "batches": [
+            {"input_folders": ["/clips/forest"], "target_minutes": 60, "count": 10, "recursive": true},
+            {"input_folders": ["/clips/sea"], "target_minutes": 30, "count": 5, "mute": true}
+        ]
+    }
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+
+from video_manager import VideoManager
+from probe_cache import ProbeCache
+from batch_manifest import BatchManifest
+from joiner_engine import VideoJoiner
+from render_estimator import ThroughputModel, estimate_batch
+from render_queue import DEFAULT_LEASE_SEC, DEFAULT_MAX_ATTEMPTS, RenderQueue, RenderWorker
+from segment_cache import DEFAULT_MAX_BYTES, SegmentCache
+from normalize_cache import DEFAULT_MAX_BYTES as NORMALIZE_MAX_BYTES, ClipNormalizer, NormalizeCache
+
+BATCH_DEFAULTS = {
+    'input_folders': [],
+    'extensions': ['.mp4'],
+    'recursive': False,
+    'target_minutes': 0,
+    'count': 1,
+    'mute': False,
+    'output_dir': None,
+    'max_jobs': None,
+    'jobs_per_device': 2,
+    'compat_mode': 'strict',
+    'tolerance_seconds': 2.0,
+    # e.g. {"dir": "/scratch/segments", "max_gb": 200}; omit to concat the sources directly
+    'segment_cache': None,
+    # 'copy', 'auto' (re-encode outputs mixing formats) or 'always'
+    'encode_mode': 'copy',
+    # Clip encodes running at once across the batch (default: half the cores)
+    'encode_workers': None,
+    # Overrides of the re-encode profile, e.g. {"width": 1280, "height": 720, "crf": 22}
+    'encode_profile': None,
+    # e.g. {"dir": "/scratch/normalized", "max_gb": 100, "workers": 2}: convert clips
+    # outside the main format once (cached) so every clip can be stream-copied
+    'normalize_cache': None,
+    # Stage timings/counters: appended as JSON lines, or Prometheus text for .prom files
+    'metrics_file': None,
+    # cProfile output (pstats format) for the whole batch
+    'profile': None,
+    # Fast local folder to render into; finished outputs are then moved to output_dir
+    'scratch_dir': None,
+}
+
+
+def load_spec(spec_path):
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    if spec_path.lower().endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit("PyYAML is required for YAML batch specs (pip install pyyaml)")
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+def expand_batches(spec):
+    """Merge top-level defaults into each batch entry and validate it"""
+    defaults = dict(BATCH_DEFAULTS)
+    defaults.update({k: v for k, v in spec.items() if k != 'batches'})
+    entries = spec.get('batches') or [{}]
+
+    batches = []
+    for i, entry in enumerate(entries):
+        batch = dict(defaults)
+        batch.update(entry)
+        if isinstance(batch['input_folders'], str):
+            batch['input_folders'] = [batch['input_folders']]
+        if 'target_seconds' in batch:
+            batch['target_duration_sec'] = float(batch['target_seconds'])
+        else:
+            batch['target_duration_sec'] = float(batch['target_minutes']) * 60
+        if not batch['input_folders']:
+            raise SystemExit(f"Batch {i+1}: no input_folders given")
+        if not batch['output_dir']:
+            batch['output_dir'] = os.path.join(batch['input_folders'][0], "Output")
+        batches.append(batch)
+    return batches
+
+
+def load_batch_videos(manager, batch):
+    count = manager.load_videos(batch['input_folders'], batch['extensions'], batch['recursive'])
+    print(f"Loaded {count} videos.", flush=True)
+    failures = manager.describe_probe_failures()
+    if failures:
+        print(failures, flush=True)
+    return count
+
+
+def make_segment_cache(cache_spec, segment_caches):
+    """Shared SegmentCache for a batch's segment_cache setting (None = no cache)"""
+    if not cache_spec:
+        return None
+    cache_spec = cache_spec if isinstance(cache_spec, dict) else {}
+    cache_key = (cache_spec.get('dir'), cache_spec.get('max_gb'))
+    if cache_key not in segment_caches:
+        max_gb = cache_spec.get('max_gb')
+        segment_caches[cache_key] = SegmentCache(
+            cache_spec.get('dir'),
+            int(max_gb * 1024 ** 3) if max_gb else DEFAULT_MAX_BYTES,
+        )
+    return segment_caches[cache_key]
+
+
+def make_normalize_cache(cache_spec, normalize_caches):
+    if not cache_spec:
+        return None
+    cache_spec = cache_spec if isinstance(cache_spec, dict) else {}
+    cache_key = (cache_spec.get('dir'), cache_spec.get('max_gb'))
+    if cache_key not in normalize_caches:
+        max_gb = cache_spec.get('max_gb')
+        normalize_caches[cache_key] = NormalizeCache(
+            cache_spec.get('dir'),
+            int(max_gb * 1024 ** 3) if max_gb else NORMALIZE_MAX_BYTES,
+        )
+    return normalize_caches[cache_key]
+
+
+def make_joiner(manager, batch, segment_cache=None, normalize_cache=None, throughput_model=None):
+    return VideoJoiner(
+        manager,
+        batch['target_duration_sec'],
+        batch['mute'],
+        batch['output_dir'],
+        int(batch['count']),
+        max_jobs=batch['max_jobs'],
+        jobs_per_device=batch['jobs_per_device'],
+        compat_mode=batch['compat_mode'],
+        segment_cache=segment_cache,
+        tolerance_sec=float(batch['tolerance_seconds']),
+        metrics_path=batch['metrics_file'],
+        profile_path=batch['profile'],
+        encode_mode=batch['encode_mode'],
+        encode_profile=batch['encode_profile'],
+        encode_workers=batch['encode_workers'],
+        normalize_cache=normalize_cache,
+        scratch_dir=batch['scratch_dir'],
+        throughput_model=throughput_model,
+    )
+
+
+def install_stop_handler(stop):
+    def handle_stop(signum, frame):
+        stop()
+
+    signal.signal(signal.SIGINT, handle_stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_stop)
+
+
+def run_batches(batches):
+    """Render every batch in order. Returns True if all outputs succeeded."""
+    all_ok = True
+    # Whatever is running now (normalizer or joiner); both have stop()
+    current = {'task': None, 'stopped': False}
+
+    def stop():
+        current['stopped'] = True
+        if current['task'] is not None:
+            current['task'].stop()
+
+    install_stop_handler(stop)
+
+    manager = VideoManager()
+    model = ThroughputModel()
+    segment_caches = {}
+    normalize_caches = {}
+    for i, batch in enumerate(batches):
+        if current['stopped']:
+            return False
+
+        print(f"=== Batch {i+1}/{len(batches)}: {', '.join(batch['input_folders'])} ===", flush=True)
+        count = load_batch_videos(manager, batch)
+        if count == 0:
+            all_ok = False
+            continue
+
+        os.makedirs(batch['output_dir'], exist_ok=True)
+
+        normalize_cache = make_normalize_cache(batch['normalize_cache'], normalize_caches)
+        if normalize_cache is not None:
+            workers = batch['normalize_cache'].get('workers') if isinstance(batch['normalize_cache'], dict) else None
+            normalizer = ClipNormalizer(manager, normalize_cache, workers=workers)
+            current['task'] = normalizer
+            normalizer.run()
+            if current['stopped']:
+                return False
+
+        segment_cache = make_segment_cache(batch['segment_cache'], segment_caches)
+        joiner = make_joiner(manager, batch, segment_cache, normalize_cache, model)
+        current['task'] = joiner
+        success, message = joiner.run()
+        print(f"Batch {i+1}: {'OK' if success else 'FAILED'} ({message})", flush=True)
+        if not success or joiner.completed_count < int(batch['count']):
+            all_ok = False
+    return all_ok
+
+
+def resume_batch(manifest_path, max_jobs=None, jobs_per_device=2, scratch_dir=None):
+    """Render the outputs of a checkpointed batch that are not finished yet"""
+    manifest = BatchManifest.load(manifest_path)
+    settings = manifest.settings
+    joiner = VideoJoiner(
+        None,
+        settings.get('target_duration_sec', 0),
+        settings.get('no_audio', False),
+        settings.get('output_folder') or os.path.dirname(os.path.abspath(manifest_path)),
+        0,
+        max_jobs=max_jobs,
+        jobs_per_device=jobs_per_device,
+        manifest=manifest,
+        encode_mode=settings.get('encode_mode', 'copy'),
+        encode_profile=settings.get('encode_profile'),
+        encode_workers=settings.get('encode_workers'),
+        scratch_dir=scratch_dir,
+        throughput_model=ThroughputModel(),
+    )
+    install_stop_handler(joiner.stop)
+    success, message = joiner.run()
+    done, total = manifest.counts()
+    print(f"Resume: {'OK' if success else 'FAILED'} ({done}/{total} outputs done)", flush=True)
+    return done == total
+
+
+def estimate_batches(batches):
+    """Print the predicted size and run time of every batch without rendering anything"""
+    manager = VideoManager()
+    model = ThroughputModel()
+    for i, batch in enumerate(batches):
+        print(f"=== Batch {i+1}/{len(batches)}: {', '.join(batch['input_folders'])} ===", flush=True)
+        count = load_batch_videos(manager, batch)
+        if count == 0:
+            continue
+        estimate = estimate_batch(
+            manager, batch['target_duration_sec'], int(batch['count']),
+            model=model,
+            encode_mode=batch['encode_mode'],
+            max_jobs=batch['max_jobs'],
+            jobs_per_device=batch['jobs_per_device'],
+            output_folder=batch['output_dir'],
+            scratch_dir=batch['scratch_dir'],
+            tolerance_sec=float(batch['tolerance_seconds']),
+            compat_mode=batch['compat_mode'],
+        )
+        for output in estimate.outputs:
+            print(f"  Video {output.index+1}: {output.clip_count} clips, {output.duration / 60:.1f} min, "
+                  f"~{output.size / 1024 ** 2:.0f} MB", flush=True)
+        print(estimate.summary(), flush=True)
+    return True
+
+
+# Batch options the queue cannot carry to other nodes, and what to use instead
+QUEUE_UNSUPPORTED = {
+    'segment_cache': "pass --segment-cache to each worker",
+    'scratch_dir': "pass --scratch-dir to each worker",
+    'normalize_cache': "use encode_mode 'auto' to re-encode mixed outputs",
+    'profile': "run the batch locally to profile it",
+}
+
+
+def enqueue_batches(batches, queue, name):
+    """Plan every batch here and put its outputs on the shared queue"""
+    for i, batch in enumerate(batches):
+        for key, instead in QUEUE_UNSUPPORTED.items():
+            if batch[key]:
+                raise SystemExit(f"Batch {i+1}: '{key}' is not supported for queued batches; {instead}")
+
+    manager = VideoManager()
+    total = 0
+    for i, batch in enumerate(batches):
+        print(f"=== Batch {i+1}/{len(batches)}: {', '.join(batch['input_folders'])} ===", flush=True)
+        count = load_batch_videos(manager, batch)
+        if count == 0:
+            continue
+        os.makedirs(batch['output_dir'], exist_ok=True)
+        joiner = make_joiner(manager, batch)
+        jobs = joiner.plan_jobs(checkpoint=False)
+        queue.enqueue(f"{name}#{i+1}", jobs, batch['mute'], {job.index: joiner.queue_settings(job) for job in jobs})
+        total += len(jobs)
+    print(f"Enqueued {total} output(s) as {name}", flush=True)
+    return total > 0
+
+
+def run_worker(queue, args):
+    cache_spec = {'dir': args.segment_cache, 'max_gb': args.segment_cache_gb} if args.segment_cache else None
+    worker = RenderWorker(
+        queue,
+        worker_id=args.id,
+        segment_cache=make_segment_cache(cache_spec, {}),
+        poll_interval=args.poll,
+        exit_when_idle=args.exit_when_idle,
+        scratch_dir=args.scratch_dir,
+    )
+    install_stop_handler(worker.stop)
+    return worker.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py", description="Random Video Joiner batch renderer")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Render the batches described in a JSON/YAML spec")
+    run_parser.add_argument('spec', help="Path to the batch spec file")
+
+    resume_parser = subparsers.add_parser('resume', help="Finish a batch from its manifest file")
+    resume_parser.add_argument('manifest', help="batch_*.manifest.json written next to the outputs")
+    resume_parser.add_argument('--max-jobs', type=int)
+    resume_parser.add_argument('--jobs-per-device', type=int, default=2)
+    resume_parser.add_argument('--scratch-dir', help="Render here, then move outputs into place")
+
+    estimate_parser = subparsers.add_parser('estimate', help="Predict output sizes and run time of a spec")
+    estimate_parser.add_argument('spec', help="Path to the batch spec file")
+
+    prune_parser = subparsers.add_parser('prune-cache', help="Drop probe cache entries of missing or changed files")
+    prune_parser.add_argument('--max-age-days', type=float, help="Also drop entries not refreshed for this long")
+
+    queue_options = argparse.ArgumentParser(add_help=False)
+    queue_options.add_argument('--queue', required=True, help="Queue database on storage every node can reach")
+    queue_options.add_argument('--lease', type=float, default=DEFAULT_LEASE_SEC,
+                               help="Seconds before an unresponsive worker's job is retried")
+    queue_options.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    enqueue_parser = subparsers.add_parser('enqueue', parents=[queue_options],
+                                           help="Plan the batches in a spec and queue them for workers")
+    enqueue_parser.add_argument('spec', help="Path to the batch spec file")
+    enqueue_parser.add_argument('--name', help="Batch name in the queue (default: spec name + time)")
+
+    worker_parser = subparsers.add_parser('worker', parents=[queue_options],
+                                          help="Render queued outputs until stopped")
+    worker_parser.add_argument('--id', help="Worker id (default: host:pid)")
+    worker_parser.add_argument('--poll', type=float, default=5.0, help="Seconds between polls when idle")
+    worker_parser.add_argument('--exit-when-idle', action='store_true', help="Stop once the queue is empty")
+    worker_parser.add_argument('--segment-cache', help="Remux cache folder (local to this node)")
+    worker_parser.add_argument('--segment-cache-gb', type=float)
+    worker_parser.add_argument('--scratch-dir', help="Local folder to render into before moving outputs")
+
+    status_parser = subparsers.add_parser('status', parents=[queue_options], help="Show queue counts")
+    status_parser.add_argument('--retry-failed', action='store_true', help="Queue failed jobs again")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        batches = expand_batches(load_spec(args.spec))
+        return 0 if run_batches(batches) else 1
+    if args.command == 'estimate':
+        return 0 if estimate_batches(expand_batches(load_spec(args.spec))) else 1
+    if args.command == 'resume':
+        return 0 if resume_batch(args.manifest, args.max_jobs, args.jobs_per_device, args.scratch_dir) else 1
+    if args.command == 'prune-cache':
+        probe_cache = ProbeCache()
+        try:
+            max_age = args.max_age_days * 86400 if args.max_age_days else None
+            print(f"Removed {probe_cache.evict_stale(max_age)} probe cache entries")
+        finally:
+            probe_cache.close()
+        return 0
+
+    queue = RenderQueue(args.queue, lease_sec=args.lease, max_attempts=args.max_attempts)
+    try:
+        if args.command == 'enqueue':
+            batches = expand_batches(load_spec(args.spec))
+            name = args.name or f"{os.path.splitext(os.path.basename(args.spec))[0]}-{int(time.time())}"
+            return 0 if enqueue_batches(batches, queue, name) else 1
+        if args.command == 'worker':
+            return 0 if run_worker(queue, args) else 1
+        if args.command == 'status':
+            if args.retry_failed:
+                print(f"Requeued {queue.retry_failed()} failed job(s)")
+            counts = queue.counts()
+            for status in ('queued', 'running', 'done', 'failed'):
+                print(f"{status:8s} {counts.get(status, 0)}")
+            return 0
+    finally:
+        queue.close()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Compact, index-based clip library.
+
+Clips are identified by integer ids. Paths are interned once; durations,
+compatibility buckets and the cycle order live in `array` buffers, so a
+library of several hundred thousand clips costs a few MB. The cycle is a
+permutation of ids with a cursor: ids before the cursor were used in this
+cycle, ids from the cursor on are still unused. Drawing a clip is O(1).
+
+Cycle state is persisted as 8-byte path hashes of the used clips, so a
+restart (or a rescan in a different order) continues the same cycle.
+"""
+
+import os
+import sys
+import random
+import struct
+import hashlib
+from array import array
+
+STATE_MAGIC = b'RVJC1\n'
+
+
+def path_key(path):
+    """Stable 64-bit id for a path, used to persist cycle state"""
+    return struct.unpack('<Q', hashlib.blake2b(path.encode('utf-8', 'surrogatepass'), digest_size=8).digest())[0]
+
+
+class ClipLibrary:
+    def __init__(self):
+        self.paths = []              # clip id -> interned path
+        self.ids = {}                # path -> clip id
+        self.durations = array('d')  # clip id -> seconds
+        self.sizes = array('q')      # clip id -> file size in bytes
+        self.bucket_of = array('l')  # clip id -> bucket id
+        self.bucket_names = []       # bucket id -> fingerprint
+        self.bucket_ids = {}         # fingerprint -> bucket id
+        self.order = array('l')      # cycle permutation of clip ids
+        self.pos = array('l')        # clip id -> index in order
+        self.cursor = 0              # order[:cursor] used, order[cursor:] unused
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _bucket_id(self, fingerprint):
+        bucket = self.bucket_ids.get(fingerprint)
+        if bucket is None:
+            bucket = len(self.bucket_names)
+            self.bucket_names.append(fingerprint)
+            self.bucket_ids[fingerprint] = bucket
+        return bucket
+
+    def add(self, path, duration, fingerprint, used=False, size=0):
+        """Add a clip to the library and the current cycle. Returns its id."""
+        if path in self.ids:
+            return self.ids[path]
+        path = sys.intern(path)
+        clip_id = len(self.paths)
+        self.paths.append(path)
+        self.ids[path] = clip_id
+        self.durations.append(duration)
+        self.sizes.append(size)
+        self.bucket_of.append(self._bucket_id(fingerprint))
+
+        # Append, then swap into a random unused slot (or into the used region)
+        self.order.append(clip_id)
+        self.pos.append(clip_id)
+        last = len(self.order) - 1
+        self._swap(last, self.cursor if used else random.randint(self.cursor, last))
+        if used:
+            self.cursor += 1
+        return clip_id
+
+    def _swap(self, i, j):
+        order = self.order
+        order[i], order[j] = order[j], order[i]
+        self.pos[order[i]] = i
+        self.pos[order[j]] = j
+
+    def _reindex(self, start, end):
+        order = self.order
+        pos = self.pos
+        for i in range(start, end):
+            pos[order[i]] = i
+
+    def remove(self, path):
+        """Drop a clip from the library and the cycle. The last clip takes over its id.
+        Returns True if the clip was present."""
+        clip_id = self.ids.pop(path, None)
+        if clip_id is None:
+            return False
+
+        # Move the clip to the end of the order (via the end of the used region)
+        p = self.pos[clip_id]
+        if p < self.cursor:
+            self.cursor -= 1
+            self._swap(p, self.cursor)
+            p = self.cursor
+        self._swap(p, len(self.order) - 1)
+        self.order.pop()
+
+        # Renumber the last clip into the freed id so the arrays stay dense
+        last = len(self.paths) - 1
+        if clip_id != last:
+            moved = self.paths[last]
+            self.paths[clip_id] = moved
+            self.ids[moved] = clip_id
+            self.durations[clip_id] = self.durations[last]
+            self.sizes[clip_id] = self.sizes[last]
+            self.bucket_of[clip_id] = self.bucket_of[last]
+            self.pos[clip_id] = self.pos[last]
+            self.order[self.pos[clip_id]] = clip_id
+        self.paths.pop()
+        self.durations.pop()
+        self.sizes.pop()
+        self.bucket_of.pop()
+        self.pos.pop()
+        return True
+
+    def set_bucket(self, clip_id, fingerprint):
+        """Move a clip to another compatibility bucket (e.g. after it was normalized)"""
+        self.bucket_of[clip_id] = self._bucket_id(fingerprint)
+
+    def fingerprint(self, clip_id):
+        return self.bucket_names[self.bucket_of[clip_id]]
+
+    def reset_cycle(self):
+        random.shuffle(self.order)
+        self._reindex(0, len(self.order))
+        self.cursor = 0
+
+    def unused_count(self, buckets=None):
+        if buckets is None:
+            return len(self.order) - self.cursor
+        bucket_of = self.bucket_of
+        return sum(1 for i in range(self.cursor, len(self.order)) if bucket_of[self.order[i]] in buckets)
+
+    def used_ids(self):
+        return self.order[:self.cursor]
+
+    def unused_ids(self):
+        return self.order[self.cursor:]
+
+    def take_next(self, buckets=None):
+        """Move the next unused clip (optionally from `buckets` only) to the used region.
+        Returns its id, or None if nothing matches."""
+        n = len(self.order)
+        if buckets is None:
+            if self.cursor >= n:
+                return None
+            clip_id = self.order[self.cursor]
+            self.cursor += 1
+            return clip_id
+
+        bucket_of = self.bucket_of
+        order = self.order
+        for j in range(self.cursor, n):
+            if bucket_of[order[j]] in buckets:
+                self._swap(j, self.cursor)
+                self.cursor += 1
+                return order[self.cursor - 1]
+        return None
+
+    def take_ids(self, clip_ids):
+        """Mark specific unused clips as used, in the given order"""
+        for clip_id in clip_ids:
+            j = self.pos[clip_id]
+            if j < self.cursor:
+                continue
+            self._swap(j, self.cursor)
+            self.cursor += 1
+
+    def recycle_buckets(self, buckets):
+        """Start a new cycle for the given buckets only: their used clips become unused.
+        Returns how many clips were recycled."""
+        used = self.order[:self.cursor]
+        keep = array('l', (c for c in used if self.bucket_of[c] not in buckets))
+        back = [c for c in used if self.bucket_of[c] in buckets]
+        random.shuffle(back)
+        end = self.cursor
+        self.order[:end] = keep + array('l', back)
+        self._reindex(0, end)
+        self.cursor = len(keep)
+        return len(back)
+
+    def release(self, clip_ids):
+        """Return clips that were taken but never used to the unused region"""
+        wanted = set(clip_ids)
+        if not wanted:
+            return 0
+        used = self.order[:self.cursor]
+        keep = array('l', (c for c in used if c not in wanted))
+        back = array('l', (c for c in used if c in wanted))
+        end = self.cursor
+        self.order[:end] = keep + back
+        self._reindex(0, end)
+        self.cursor = len(keep)
+        return len(back)
+
+    def save_state(self, state_path):
+        """Persist which clips were used in the current cycle"""
+        keys = array('Q', (path_key(self.paths[c]) for c in self.order[:self.cursor]))
+        temp_path = state_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(STATE_MAGIC)
+            keys.tofile(f)
+        os.replace(temp_path, state_path)
+
+    @staticmethod
+    def load_state(state_path):
+        """Return the set of used path keys saved by save_state, or an empty set"""
+        keys = array('Q')
+        try:
+            with open(state_path, 'rb') as f:
+                if f.read(len(STATE_MAGIC)) != STATE_MAGIC:
+                    return set()
+                data = f.read()
+            keys.frombytes(data[:len(data) - len(data) % keys.itemsize])
+        except OSError:
+            return set()
+        return set(keys)
@@ -0,0 +1,110 @@
+import os
+import threading
+
+
+class DiskLRUCache:
+    """Folder of generated files capped by total size, evicting least recently used.
+
+    Entries are plain files named `<key><suffix>`; a file's mtime is bumped on
+    every hit and serves as its LRU timestamp, so the cache survives restarts
+    without a separate index. Files are built under a temp name and renamed
+    into place, so a crash never leaves a half-written entry behind.
+    """
+
+    def __init__(self, cache_dir, max_bytes, suffix):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def _key_lock(self, key):
+        with self.lock:
+            if key not in self.key_locks:
+                self.key_locks[key] = threading.Lock()
+            return self.key_locks[key]
+
+    def get(self, key):
+        """Return the cached path for `key` and mark it as recently used, or None"""
+        path = self.path_for(key)
+        try:
+            os.utime(path, None)
+            return path
+        except OSError:
+            return None
+
+    def get_or_create(self, key, build):
+        """Return the cached path for `key`, calling `build(temp_path)` to create it on a miss.
+        `build` returns True on success. Concurrent callers for the same key wait for one build."""
+        with self._key_lock(key):
+            path = self.get(key)
+            if path is not None:
+                return path
+
+            temp_path = os.path.join(self.cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp{self.suffix}")
+            try:
+                if not build(temp_path) or not os.path.exists(temp_path):
+                    return None
+                os.replace(temp_path, self.path_for(key))
+            finally:
+                if os.path.exists(temp_path):
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+
+        self.evict(keep=key)
+        return self.path_for(key)
+
+    def entries(self):
+        """List (path, size, mtime) for all finished cache entries"""
+        result = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.suffix) or '.tmp' in entry.name:
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    result.append((entry.path, st.st_size, st.st_mtime))
+        except OSError:
+            pass
+        return result
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        if not self.max_bytes:
+            return 0
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        keep_path = self.path_for(keep) if keep else None
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
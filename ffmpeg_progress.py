@@ -0,0 +1,76 @@
+"""
+Parser for ffmpeg's machine-readable `-progress` output.
+
+ffmpeg writes blocks of key=value lines, each block terminated by
+`progress=continue` (or `progress=end` on the last one).
+"""
+
+import time
+
+
+def _parse_speed(value):
+    # "1.53x", or "N/A" early on
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return 0.0
+
+
+class FfmpegProgress:
+    def __init__(self, expected_duration=0):
+        self.expected_duration = expected_duration
+        self.started = time.monotonic()
+        self.out_time = 0.0     # seconds of output written
+        self.speed = 0.0        # media seconds per wall second
+        self.bitrate = ''       # e.g. "2345.6kbits/s"
+        self.total_size = 0
+        self.finished = False
+        self._block = {}
+
+    def feed(self, line):
+        """Consume one line. Returns True when a complete progress block was parsed."""
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return False
+        self._block[key] = value
+        if key != 'progress':
+            return False
+
+        block, self._block = self._block, {}
+        # out_time_ms is in microseconds as well (long-standing ffmpeg quirk)
+        micros = block.get('out_time_us') or block.get('out_time_ms')
+        try:
+            self.out_time = max(0.0, int(micros) / 1_000_000)
+        except (TypeError, ValueError):
+            pass
+        self.speed = _parse_speed(block.get('speed', '')) or self.speed
+        self.bitrate = block.get('bitrate', self.bitrate)
+        try:
+            self.total_size = int(block.get('total_size', self.total_size))
+        except ValueError:
+            pass
+        self.finished = value == 'end'
+        return True
+
+    @property
+    def fraction(self):
+        if self.finished:
+            return 1.0
+        if self.expected_duration <= 0:
+            return 0.0
+        return min(1.0, self.out_time / self.expected_duration)
+
+    @property
+    def eta(self):
+        """Seconds left for this run, or -1 if unknown"""
+        if self.finished:
+            return 0.0
+        if self.expected_duration <= 0:
+            return -1.0
+        remaining = max(0.0, self.expected_duration - self.out_time)
+        if self.speed > 0:
+            return remaining / self.speed
+        elapsed = time.monotonic() - self.started
+        if self.out_time > 0:
+            return remaining * elapsed / self.out_time
+        return -1.0
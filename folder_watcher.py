@@ -0,0 +1,282 @@
+"""
+Incremental folder watching.
+
+Keeps a VideoManager in sync with its input folders after the initial scan:
+new clips are probed and added to the current cycle, deleted clips are
+dropped and changed clips re-probed. A file is only picked up once its
+size and mtime have stopped changing for `settle_sec`, so clips that are
+still being copied in are left alone.
+
+On Linux, inotify (through ctypes) says which paths changed; elsewhere, or
+if inotify is unavailable, the folders are polled. Either way a full
+rescan runs every `rescan_interval` to catch anything events missed
+(e.g. changes made by other machines on a network share).
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+from library_scanner import DEFAULT_EXTENSIONS, iter_video_files, normalize_extensions
+from probe_cache import file_signature
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+              | IN_DELETE_SELF | IN_MODIFY)
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+class Inotify:
+    """Minimal ctypes binding: add_watch() directories, read() (path, mask) events"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # wd -> directory
+
+    def add_watch(self, directory):
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watches[wd] = directory
+        return wd
+
+    def read(self, timeout):
+        """Wait up to `timeout` seconds; return a list of (path, mask) events"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+            elif directory is not None:
+                events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Watches input folders and applies changes to a VideoManager as they settle.
+
+    `on_change(added, removed, total)` is called after each applied change.
+    Probing runs on the watcher's own thread and the manager lock is only
+    held for the library update, so renders are never blocked.
+    """
+
+    def __init__(self, video_manager, folders, extensions=DEFAULT_EXTENSIONS, recursive=False,
+                 settle_sec=3.0, poll_interval=5.0, rescan_interval=600.0, use_inotify=True,
+                 on_change=None, on_log=None):
+        self.video_manager = video_manager
+        self.folders = [folders] if isinstance(folders, str) else list(folders)
+        self.extensions = normalize_extensions(extensions)
+        self.recursive = recursive
+        self.settle_sec = settle_sec
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.use_inotify = use_inotify and sys.platform.startswith('linux')
+        self.on_change = on_change
+        self.on_log = on_log
+        self.stop_event = threading.Event()
+        self.known = {}     # path -> signature already handled (added or rejected)
+        self.pending = {}   # path -> (signature, time it was last seen changing)
+        self.inotify = None
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+        else:
+            print(message, flush=True)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _matches(self, path):
+        return path.lower().endswith(self.extensions)
+
+    def _scan(self, folders=None):
+        snapshot = {}
+        for folder in folders or self.folders:
+            snapshot.update(iter_video_files(folder, self.extensions, self.recursive))
+        return snapshot
+
+    def _start_inotify(self):
+        try:
+            inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            self.log(f"inotify unavailable ({e}); polling for changes")
+            return None
+        try:
+            for folder in self.folders:
+                self._watch_tree(inotify, folder)
+        except OSError as e:
+            # Usually fs.inotify.max_user_watches; polling still works
+            self.log(f"Cannot watch folders with inotify ({e}); polling for changes")
+            inotify.close()
+            return None
+        return inotify
+
+    def _watch_tree(self, inotify, folder):
+        inotify.add_watch(folder)
+        if not self.recursive:
+            return
+        for root, dirs, _ in os.walk(folder):
+            for d in dirs:
+                inotify.add_watch(os.path.join(root, d))
+
+    def _diff(self, snapshot, now):
+        """Queue new or changed files from a full snapshot; return paths that disappeared"""
+        for path, signature in snapshot.items():
+            if self.known.get(path) != signature and path not in self.pending:
+                self.pending[path] = (signature, now)
+        return [path for path in self.known if path not in snapshot]
+
+    def _handle_events(self, events, now):
+        removed = []
+        for path, mask in events:
+            if path is None:
+                # Event queue overflowed: fall back to a full rescan
+                removed.extend(self._diff(self._scan(), now))
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive:
+                    try:
+                        self._watch_tree(self.inotify, path)
+                    except OSError as e:
+                        self.log(f"Cannot watch {path}: {e}")
+                    # Files may have landed before the watch was in place
+                    removed.extend(p for p in self._diff(self._scan([path]), now) if p.startswith(path + os.sep))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    removed.extend(p for p in self.known if p.startswith(path + os.sep))
+                continue
+            if not self._matches(path):
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.pending.pop(path, None)
+                if path in self.known:
+                    removed.append(path)
+            elif path not in self.pending:
+                signature = file_signature(path)
+                if signature is not None and self.known.get(path) != signature:
+                    self.pending[path] = (signature, now)
+        return removed
+
+    def _settled(self, now):
+        """Pending files whose signature stayed the same for settle_sec"""
+        ready = {}
+        for path, (signature, since) in list(self.pending.items()):
+            current = file_signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle_sec:
+                ready[path] = signature
+                del self.pending[path]
+        return ready
+
+    def _apply(self, ready, removed):
+        removed = [p for p in set(removed) if p in self.known and p not in ready]
+        for path in removed:
+            del self.known[path]
+        removed_count = self.video_manager.remove_videos(removed) if removed else 0
+
+        added = []
+        if ready:
+            added = self.video_manager.update_videos(ready)
+            # Remember unplayable files too, so they are not probed again until they change
+            self.known.update(ready)
+
+        if added or removed_count:
+            self.video_manager.save_cycle_state()
+            self.log(f"Library updated: {len(added)} added/updated, {removed_count} removed.")
+            if self.on_change:
+                self.on_change(len(added), removed_count, len(self.video_manager.all_videos))
+
+    def run(self):
+        """Watch until stop() is called"""
+        now = time.monotonic()
+        with self.video_manager.lock:
+            in_library = set(self.video_manager.all_videos)
+        for path, signature in self._scan().items():
+            if path in in_library:
+                self.known[path] = signature
+            else:
+                # Arrived since the library was loaded (or was rejected then; it is retried once)
+                self.pending[path] = (signature, now)
+
+        if self.use_inotify:
+            self.inotify = self._start_inotify()
+        last_rescan = now
+
+        try:
+            while not self.stop_event.is_set():
+                # Wake up often enough to notice files settling
+                timeout = min(self.poll_interval, self.settle_sec / 2) if self.pending else self.poll_interval
+                removed = []
+                if self.inotify is not None:
+                    events = self.inotify.read(timeout)
+                    now = time.monotonic()
+                    removed.extend(self._handle_events(events, now))
+                else:
+                    self.stop_event.wait(timeout)
+                    now = time.monotonic()
+                    if now - last_rescan >= self.poll_interval:
+                        removed.extend(self._diff(self._scan(), now))
+                        last_rescan = now
+
+                if now - last_rescan >= self.rescan_interval:
+                    removed.extend(self._diff(self._scan(), now))
+                    last_rescan = now
+
+                if self.stop_event.is_set():
+                    break
+                try:
+                    self._apply(self._settled(now), removed)
+                except Exception as e:
+                    self.log(f"Error updating library: {e}")
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
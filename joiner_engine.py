@@ -0,0 +1,731 @@
+import os
+import shutil
+import subprocess
+import time
+import queue
+import tempfile
+import threading
+from collections import deque
+
+from batch_manifest import MANIFEST_SUFFIX, BatchManifest, partial_path
+from ffmpeg_progress import FfmpegProgress
+from library_scanner import DEFAULT_EXTENSIONS
+from metrics import Metrics, Profiler
+from process_control import POLL_INTERVAL, poll_usage, stop_process
+from render_estimator import throughput_mode
+from render_scheduler import RenderJob, RenderScheduler, device_of, estimate_output_bytes, free_bytes
+from segment_encode import EncodeProfile, default_encode_workers, encode_segments
+from segment_cache import append_files, build_remux_command, choose_join_method
+from selection_planner import DEFAULT_TOLERANCE_SEC, plan_batch
+from video_manager import VideoManager
+
+# Minimum seconds between progress callbacks for one output
+PROGRESS_INTERVAL = 0.25
+# Headroom over the clips' combined size when checking for free space
+FREE_SPACE_MARGIN = 1.05
+
+class VideoJoiner:
+    """Qt-free selection and concat engine.
+
+    Used directly by the batch CLI and wrapped by VideoJoinerThread for the GUI.
+    """
+
+    def __init__(self, video_manager, target_duration_sec, no_audio, output_folder, video_count,
+                 max_jobs=None, jobs_per_device=2, compat_mode='strict', segment_cache=None,
+                 tolerance_sec=DEFAULT_TOLERANCE_SEC, metrics_path=None, profile_path=None, manifest=None,
+                 encode_mode='copy', encode_profile=None, encode_workers=None, normalize_cache=None,
+                 scratch_dir=None, throughput_model=None, on_log=None, on_progress=None, on_job_progress=None, on_finished=None):
+        self.video_manager = video_manager
+        self.target_duration_sec = target_duration_sec
+        self.no_audio = no_audio
+        self.output_folder = output_folder
+        self.video_count = video_count
+        self.max_jobs = max_jobs
+        self.jobs_per_device = jobs_per_device
+        # 'strict': every output draws from one stream-compatible bucket
+        # 'flag': draw from the whole library but warn about mixed outputs
+        self.compat_mode = compat_mode
+        # How far an output may land from target_duration_sec
+        self.tolerance_sec = tolerance_sec
+        # Optional SegmentCache: remux each clip to MPEG-TS once and join segments
+        self.segment_cache = segment_cache
+        # 'copy': stream-copy concat only; 'auto': re-encode outputs that mix
+        # stream formats; 'always': re-encode every output. Re-encoding runs up to
+        # `encode_workers` clip encodes at once, over all outputs, to `encode_profile` (an
+        # EncodeProfile, or a dict overriding the output's dominant format).
+        self.encode_mode = encode_mode
+        self.encode_profile = encode_profile
+        self.encode_workers = encode_workers
+        self.encode_slots = threading.BoundedSemaphore(encode_workers or default_encode_workers())
+        # Clips known to have no audio track when there is no library to ask (queue workers)
+        self.silent_clips = set()
+        # NormalizeCache used to rebuild normalized clip copies that were evicted
+        self.normalize_cache = normalize_cache
+        # Fast local folder: outputs, concat lists and encode segments are written
+        # here and finished outputs moved to output_folder (one at a time per disk)
+        self.scratch_dir = scratch_dir
+        self.move_locks = {}
+        # ThroughputModel that learns from every fully rendered batch
+        self.throughput_model = throughput_model
+        self.is_running = True
+        self.scheduler = None
+        self.lock = threading.Lock()
+        self.processes = set()
+        self.completed_count = 0
+
+        # Stage timings and counters; written to metrics_path (JSON lines or
+        # .prom text) after each batch. profile_path turns on cProfile.
+        self.metrics = Metrics()
+        self.metrics_path = metrics_path
+        self.profile_path = profile_path
+
+        # BatchManifest checkpoint; given one, run() resumes it instead of planning
+        self.manifest = manifest
+
+        # Callbacks; the GUI wires these to Qt signals, the CLI to stdout
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.on_job_progress = on_job_progress
+        self.on_finished = on_finished
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+        else:
+            print(message, flush=True)
+
+    def _emit_progress(self, completed):
+        if self.on_progress:
+            self.on_progress(completed)
+
+    def _emit_job_progress(self, index, fraction, eta=-1.0):
+        if self.on_job_progress:
+            self.on_job_progress(index, fraction, eta)
+
+    def _finish(self, success, message):
+        if self.on_finished:
+            self.on_finished(success, message)
+        return success, message
+
+    def run(self):
+        """Plan and render the whole batch. Returns (success, message)."""
+        profiler = Profiler() if self.profile_path else None
+        try:
+            if profiler is not None:
+                return profiler.wrap(self._run)(profiler)
+            return self._run()
+        finally:
+            self.stop_all_processes()
+            summary = self.metrics.summary()
+            if summary:
+                self.log(f"Timing: {summary}")
+            self.export_metrics()
+            if profiler is not None:
+                if profiler.dump(self.profile_path):
+                    self.log(f"Profile written to {self.profile_path}")
+                elif profiler.skipped:
+                    self.log("No profile written: another profiler was already active")
+
+    def export_metrics(self):
+        if not self.metrics_path:
+            return
+        # Include the manager's scan/probe stages alongside the batch's own
+        combined = Metrics()
+        if self.video_manager is not None:
+            combined.update(self.video_manager.metrics)
+        combined.update(self.metrics)
+        try:
+            combined.write(self.metrics_path, output_folder=self.output_folder)
+        except OSError as e:
+            self.log(f"Could not write metrics: {e}")
+
+    def _run(self, profiler=None):
+        try:
+            # Plan every output up front so the clip cycle is consumed in order,
+            # then render them concurrently.
+            if self.manifest is not None:
+                jobs = self.manifest.pending_jobs()
+                done, total = self.manifest.counts()
+                self.log(f"Resuming {os.path.basename(self.manifest.path)}: {done}/{total} done, "
+                         f"{len(jobs)} left to render.")
+                self.video_count = len(jobs)
+                if not jobs:
+                    return self._finish(True, "0")
+                self.video_manager = self.manifest_video_manager()
+                if self.video_manager is not None:
+                    # Released when the batch was cancelled; they are this batch's again
+                    self.video_manager.claim_videos([clip for job in jobs for clip in job.clips])
+                else:
+                    self.log("⚠ This manifest does not record its input folders; "
+                             "its clips are not marked as used in their cycle.")
+            else:
+                jobs = self.plan_jobs()
+            if not self.is_running:
+                self.release_unrendered(jobs)
+                self.log("Process cancelled by user.")
+                return self._finish(False, "Process stopped by user")
+            if not jobs:
+                return self._finish(False, "No videos were generated successfully")
+
+            self.scheduler = RenderScheduler(
+                profiler.wrap_worker(self.render_job) if profiler is not None else self.render_job,
+                max_jobs=self.max_jobs,
+                jobs_per_device=self.jobs_per_device,
+                scratch_dir=self.scratch_dir,
+                on_job_started=self._on_job_started,
+                on_job_finished=self._on_job_finished,
+            )
+            concurrent = self.scheduler.concurrency(jobs)
+            if concurrent < min(self.scheduler.max_jobs, len(jobs)):
+                self.log(f"Only {concurrent} of {self.scheduler.max_jobs} parallel jobs can run: every output "
+                         f"reads or writes the same disk (jobs per disk: {self.jobs_per_device}).")
+            if not self.check_free_space(jobs, concurrent):
+                self.release_unrendered(jobs)
+                if self.manifest is not None:
+                    self.log(f"Free up space, then resume from {self.manifest.path}")
+                return self._finish(False, "Not enough free disk space")
+            if not self.is_running:
+                self.scheduler.cancel_all()
+            self.log(f"Rendering {len(jobs)} video(s), up to {concurrent} at a time...")
+            render_start = time.monotonic()
+            successful_count = self.scheduler.run(jobs)
+            if successful_count == len(jobs) and self.throughput_model is not None:
+                self.throughput_model.record(
+                    throughput_mode(self.encode_mode),
+                    self.scheduler.peak_running,
+                    time.monotonic() - render_start,
+                    sum(estimate_output_bytes(job) for job in jobs),
+                    sum(job.duration for job in jobs),
+                )
+            self.release_unrendered(jobs)
+            io_summary = self.scheduler.io_stats.summary()
+            if io_summary:
+                self.log(f"I/O: {io_summary}")
+
+            if not self.is_running:
+                self.log("Process cancelled by user.")
+            if successful_count < len(jobs) and self.manifest is not None:
+                self.log(f"Unfinished outputs can be resumed from {self.manifest.path}")
+
+            if successful_count == self.video_count:
+                return self._finish(True, str(successful_count))
+            elif successful_count > 0:
+                return self._finish(True, f"{successful_count}/{self.video_count}")
+            elif not self.is_running:
+                return self._finish(False, "Process stopped by user")
+            else:
+                return self._finish(False, "No videos were generated successfully")
+                
+        except Exception as e:
+            self.log(f"Error: {str(e)}")
+            return self._finish(False, str(e))
+
+    def plan_jobs(self, checkpoint=True):
+        """Plan the clips for every output before anything is rendered.
+        With `checkpoint`, the plan is saved as a manifest next to the outputs."""
+        with self.metrics.timer('select'):
+            plan = plan_batch(
+                self.video_manager,
+                self.target_duration_sec,
+                self.video_count,
+                tolerance_sec=self.tolerance_sec,
+                compat_mode=self.compat_mode,
+            )
+        self.log(f"Planned {len(plan.outputs)} video(s) from {len(self.video_manager.library)} clips.")
+
+        jobs = []
+        timestamp = int(time.time())
+        for output in plan.outputs:
+            i = output.index
+            if not output.clips:
+                self.log(f"✗ Video {i+1}: no videos selected")
+                continue
+
+            self.log(f"Video {i+1}: {len(output.clips)} videos - Total: {output.duration:.2f}s")
+            if self.target_duration_sec > 0 and not output.within_tolerance:
+                self.log(f"  Off target by {output.duration - self.target_duration_sec:+.1f}s "
+                         f"(tolerance {self.tolerance_sec:.1f}s)")
+            if output.mixed:
+                self.log(f"⚠ Mixed stream formats in video {i+1} ({len(output.fingerprints)} kinds); "
+                         "stream-copy concat may stutter or fail.")
+
+            output_file = os.path.join(self.output_folder, f"output_{timestamp}_{i+1}.mp4")
+            jobs.append(RenderJob(i, output_file, output.clips, output.duration, output.sources))
+
+        # Remember what this batch consumed so the next session continues the cycle
+        self.video_manager.save_cycle_state()
+
+        if checkpoint and jobs:
+            manifest_path = os.path.join(self.output_folder, f"batch_{timestamp}{MANIFEST_SUFFIX}")
+            settings = {
+                # Lets a resume load the same library and claim the batch's clips in its cycle
+                'input_folders': list(self.video_manager.folders),
+                'extensions': list(self.video_manager.extensions),
+                'recursive': self.video_manager.recursive,
+                'target_duration_sec': self.target_duration_sec,
+                'no_audio': self.no_audio,
+                'output_folder': self.output_folder,
+                'compat_mode': self.compat_mode,
+                'tolerance_sec': self.tolerance_sec,
+                # Outputs that were to be re-encoded must be re-encoded when resumed too
+                'encode_mode': self.encode_mode,
+                'encode_profile': (vars(self.encode_profile) if isinstance(self.encode_profile, EncodeProfile)
+                                   else self.encode_profile),
+                'encode_workers': self.encode_workers,
+            }
+            try:
+                self.manifest = BatchManifest.create(manifest_path, settings, jobs)
+                self.log(f"Batch manifest: {manifest_path}")
+            except OSError as e:
+                self.log(f"Could not write batch manifest: {e}")
+        return jobs
+
+    def manifest_video_manager(self):
+        """VideoManager for the input folders of the manifest being resumed: the current
+        one if it was loaded from them, otherwise a new one loaded here"""
+        settings = self.manifest.settings
+        folders = settings.get('input_folders')
+        if not folders:
+            # Older manifest: the current library is the best guess
+            return self.video_manager
+        if self.video_manager is not None and self.video_manager.is_loaded_from(folders):
+            return self.video_manager
+        self.log(f"Loading clips from {', '.join(folders)}...")
+        manager = VideoManager()
+        count = manager.load_videos(folders, settings.get('extensions') or DEFAULT_EXTENSIONS,
+                                    settings.get('recursive', False))
+        self.log(f"Loaded {count} videos.")
+        return manager
+
+    def queue_settings(self, job):
+        """How a planned job must be rendered by a queue worker, which has no library
+        to tell stream formats apart: re-encoding is decided here"""
+        if not self.needs_reencode(job):
+            return {'encode_mode': 'copy'}
+        return {
+            'encode_mode': 'always',
+            'encode_profile': vars(self.profile_for(job)),
+            'encode_workers': self.encode_workers,
+            'silent_clips': [c for c in job.sources if not self._has_audio(c)],
+        }
+
+    def release_unrendered(self, jobs):
+        """Put the clips of outputs that were not rendered back into the unused part of the cycle"""
+        if self.video_manager is None:
+            return
+        rendered = {clip for job in jobs if job.status == 'done' for clip in job.clips}
+        clips = [clip for job in jobs if job.status != 'done' for clip in job.clips if clip not in rendered]
+        released = self.video_manager.release_videos(clips) if clips else 0
+        if released:
+            self.log(f"Returned {released} unrendered clip(s) to the cycle.")
+
+    @property
+    def work_dir(self):
+        return self.scratch_dir or self.output_folder
+
+    def check_free_space(self, jobs, concurrent):
+        """Check that the planned outputs fit on the output disk, and the ones rendering
+        at once on the scratch disk, before anything is rendered. Sizes are estimated
+        from the clips (only a rough guess for re-encoded outputs)."""
+        sizes = sorted((estimate_output_bytes(job) * FREE_SPACE_MARGIN for job in jobs), reverse=True)
+        needs = [(self.output_folder, sum(sizes))]
+        if self.scratch_dir and device_of(self.scratch_dir) != device_of(self.output_folder):
+            needs.append((self.scratch_dir, sum(sizes[:concurrent])))
+        for folder, needed in needs:
+            free = free_bytes(folder)
+            if free is not None and needed > free:
+                self.log(f"✗ Not enough free space in {folder}: about {needed / 1024 ** 3:.1f} GB needed, "
+                         f"{free / 1024 ** 3:.1f} GB free.")
+                return False
+        return True
+
+    def _on_job_started(self, job):
+        self._checkpoint(job)
+        self.log(f"Started video {job.index+1}: {os.path.basename(job.output_file)}")
+
+    def _checkpoint(self, job):
+        if self.manifest is None:
+            return
+        try:
+            self.manifest.mark(job.index, job.status)
+        except OSError as e:
+            self.log(f"Could not update batch manifest: {e}")
+
+    def _on_job_finished(self, job):
+        self._checkpoint(job)
+        self._emit_job_progress(job.index, 1.0, 0.0)
+        if job.status == 'done':
+            with self.lock:
+                self.completed_count += 1
+                completed = self.completed_count
+            self._emit_progress(completed)
+            self.log(f"✓ Video {job.index+1} completed: {os.path.basename(job.output_file)}")
+        elif job.status == 'failed':
+            self.log(f"✗ Video {job.index+1} failed")
+
+    def generate_single_video(self, output_file):
+        plan = plan_batch(self.video_manager, self.target_duration_sec, 1,
+                          tolerance_sec=self.tolerance_sec, compat_mode=self.compat_mode)
+        if not plan.outputs or not plan.outputs[0].clips:
+            self.log("No videos selected for this output.")
+            return False
+        output = plan.outputs[0]
+        return self.render_job(RenderJob(0, output_file, output.clips, output.duration, output.sources))
+
+    def render_job(self, job, should_commit=None):
+        """Render one output under a temporary name and move it into place when complete.
+        If `should_commit()` turns False (e.g. a queue lease was lost), the result is discarded."""
+        clips = self.source_clips(job)
+        if clips is None:
+            return False
+        self.metrics.incr('bytes_read', sum(os.path.getsize(c) for c in clips if os.path.exists(c)))
+        part_file = partial_path(job.output_file, job.part_tag)
+        render_file = part_file
+        if self.scratch_dir:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            render_file = os.path.join(self.scratch_dir, os.path.basename(part_file))
+        with self.metrics.timer('render'):
+            success = self._render(job, clips, render_file)
+        if success and should_commit is not None and not should_commit():
+            self.log(f"Discarding {os.path.basename(job.output_file)}: no longer ours to finish")
+            success = False
+        try:
+            if success:
+                if render_file != part_file:
+                    self.move_to_output(job, render_file, part_file)
+                os.replace(part_file, job.output_file)
+                self.metrics.incr('bytes_written', os.path.getsize(job.output_file))
+        except OSError as e:
+            self.log(f"Could not finish {os.path.basename(job.output_file)}: {e}")
+            success = False
+        if not success:
+            # ffmpeg has exited (and was reaped) by now, so partial files can go. Their
+            # names are this attempt's own, so another renderer's files are left alone.
+            for path in {render_file, part_file}:
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError as e:
+                    self.log(f"Could not remove partial output {path}: {e}")
+        return success
+
+    def move_to_output(self, job, staged_file, part_file):
+        """Copy an output rendered on the scratch disk into the output folder"""
+        with self.lock:
+            move_lock = self.move_locks.setdefault(job.device, threading.Lock())
+        # One copy per output disk at a time keeps the writes sequential
+        with move_lock, self.metrics.timer('move'):
+            self.log(f"Moving {os.path.basename(job.output_file)} to the output folder...")
+            shutil.move(staged_file, part_file)
+
+    def source_clips(self, job):
+        """Files to read for a job: the sources pinned when it was planned. Returns None
+        if a normalized copy is gone and cannot be rebuilt, since swapping the original
+        back in would mix stream formats."""
+        sources = []
+        for clip, source in zip(job.clips, job.sources):
+            if source != clip and not os.path.exists(source):
+                source = self.renormalize(clip)
+                if source is None:
+                    self.log(f"✗ Normalized copy of {os.path.basename(clip)} is missing; "
+                             f"cannot render video {job.index+1}")
+                    return None
+            sources.append(source)
+        return sources
+
+    def renormalize(self, clip):
+        """Rebuild the normalized copy of a clip after it was evicted from the cache"""
+        if self.normalize_cache is None or self.video_manager is None or clip not in self.video_manager.normalized:
+            return None
+        fingerprint = self.video_manager.get_fingerprint(clip)
+        original = self.video_manager.normalized[clip][1]
+        self.log(f"Re-creating normalized copy of {os.path.basename(clip)}")
+        cached = self.normalize_cache.get_normalized(clip, EncodeProfile.from_fingerprint(fingerprint),
+                                                     self._run_quiet, has_audio=not original.endswith('noaudio'))
+        if cached is not None:
+            self.video_manager.mark_normalized(clip, cached, fingerprint)
+        return cached
+
+    def _render(self, job, clips, output_file):
+        if self.needs_reencode(job):
+            return self.render_reencoded(job, clips, output_file)
+
+        if self.segment_cache is not None:
+            result = self.render_from_segments(job, clips, output_file)
+            if result is not None:
+                return result
+            if not self.is_running:
+                return False
+            self.log("Remux cache unavailable for this output, using concat list instead.")
+
+        temp_list_file = None
+        try:
+            self.log(f"Prepared {len(clips)} videos for joining.")
+            temp_list_file = self.write_list_file(clips, self.work_dir)
+            return self.run_simple_concat(temp_list_file, output_file, job)
+
+        except Exception as e:
+            self.log(f"Error in render_job: {str(e)}")
+            return False
+        finally:
+            if temp_list_file and os.path.exists(temp_list_file):
+                try:
+                    os.remove(temp_list_file)
+                except:
+                    pass
+
+    def write_list_file(self, clips, folder):
+        """Write a concat demuxer list for `clips` into `folder` and return its path"""
+        # Use the output (or scratch) folder for temp files to avoid permission issues with FFmpeg on Windows
+        with self.metrics.timer('list_write'):
+            fd, temp_list_file = tempfile.mkstemp(suffix=".txt", prefix="ffmpeg_list_", dir=folder, text=True)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for video in clips:
+                    # FFmpeg concat requires forward slashes on Windows and proper escaping
+                    # Replace backslash with forward slash
+                    normalized_path = video.replace(os.sep, '/')
+                    # Escape single quotes
+                    escaped_path = normalized_path.replace("'", "'\\\\''")
+                    f.write(f"file '{escaped_path}'\n")
+
+        # Use forward slashes for the list file path itself too, just in case
+        return temp_list_file.replace(os.sep, '/')
+
+    def needs_reencode(self, job):
+        if self.encode_mode == 'always':
+            return True
+        if self.encode_mode == 'auto' and self.video_manager is not None:
+            return len({self.video_manager.get_fingerprint(c) for c in job.clips}) > 1
+        return False
+
+    def profile_for(self, job):
+        """Encode profile for an output: the configured one, or its dominant stream format
+        (with `encode_profile` overrides when that is a dict)"""
+        if isinstance(self.encode_profile, EncodeProfile):
+            return self.encode_profile
+        overrides = self.encode_profile or {}
+        if self.video_manager is None:
+            return EncodeProfile(**overrides)
+        totals = {}
+        for clip in job.clips:
+            fingerprint = self.video_manager.get_fingerprint(clip)
+            totals[fingerprint] = totals.get(fingerprint, 0.0) + self.video_manager.get_duration(clip)
+        return EncodeProfile.from_fingerprint(max(totals, key=totals.get), **overrides)
+
+    def _has_audio(self, clip):
+        if self.video_manager is None:
+            return clip not in self.silent_clips
+        return not self.video_manager.get_fingerprint(clip).endswith('noaudio')
+
+    def render_reencoded(self, job, clips, output_file):
+        """Encode every clip to one profile in parallel, then stream-copy join the segments"""
+        profile = self.profile_for(job)
+        # Audio presence follows the clip (or its normalized copy's) fingerprint
+        has_audio = {source: self._has_audio(clip) for clip, source in zip(job.clips, clips)}
+        self.log(f"Re-encoding {len(clips)} clips to {profile.key()}...")
+        segment_dir = tempfile.mkdtemp(prefix="rvj_encode_", dir=self.work_dir)
+        encoded = []
+
+        def on_segment_done(i):
+            with self.lock:
+                encoded.append(i)
+                fraction = len(encoded) / len(clips)
+            # Leave a little for the final join
+            job.progress = fraction * 0.95
+            self._emit_job_progress(job.index, job.progress)
+
+        try:
+            with self.metrics.timer('encode'):
+                segments = encode_segments(
+                    clips, profile, segment_dir, self._run_quiet,
+                    has_audio=has_audio.get,
+                    no_audio=self.no_audio,
+                    workers=self.encode_workers,
+                    slots=self.encode_slots,
+                    should_continue=lambda: self.is_running,
+                    on_segment_done=on_segment_done,
+                )
+            if segments is None:
+                return False
+
+            self.log(f"Joining {len(segments)} encoded segments...")
+            list_file = self.write_list_file(segments, segment_dir)
+            return self.run_simple_concat(list_file, output_file)
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+
+    def render_from_segments(self, job, clips, output_file):
+        """Build an output from cached MPEG-TS segments. Returns None if a segment
+        could not be produced, so the caller can fall back to the concat list."""
+        segments = []
+        for clip in clips:
+            if not self.is_running:
+                return None
+            segment = self.segment_cache.get_segment(clip, self._run_quiet)
+            if segment is None:
+                self.log(f"Could not remux {os.path.basename(clip)} into the cache")
+                return None
+            segments.append(segment)
+
+        method = choose_join_method(segments)
+        joined_ts = None
+        try:
+            if method == 'protocol':
+                input_url = "concat:" + "|".join(segments)
+            else:
+                # Kernel-side byte append, then a single remux into the MP4
+                joined_ts = os.path.splitext(output_file)[0] + ".joined.ts"
+                append_files(segments, joined_ts)
+                input_url = joined_ts
+
+            self.log(f"Joining {len(segments)} cached segments ({method})...")
+            cmd = build_remux_command(input_url, output_file, self.no_audio)
+            return self.execute_ffmpeg(cmd, job)
+        finally:
+            if joined_ts and os.path.exists(joined_ts):
+                try:
+                    os.remove(joined_ts)
+                except OSError:
+                    pass
+
+    def _run_quiet(self, cmd):
+        return self._try_ffmpeg(cmd, self._startupinfo())
+
+    def _startupinfo(self):
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        return startupinfo
+
+    def stop(self):
+        """Cancel the batch. Returns at once: every running ffmpeg notices within
+        POLL_INTERVAL and is stopped (q, terminate, kill) and reaped by its own thread."""
+        self.is_running = False
+        if self.scheduler is not None:
+            self.scheduler.cancel_all()
+
+    def stop_all_processes(self):
+        """Stop and reap any ffmpeg still running (normally none once run() returns)"""
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            stop_process(process)
+
+    def run_simple_concat(self, temp_list_file, output_file, job=None):
+        cmd = [
+            'ffmpeg',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', temp_list_file,
+        ]
+        
+        # Fast codec copy (works well with same-format videos)
+        if self.no_audio:
+            cmd.append('-an')
+        cmd.extend(['-c', 'copy'])
+        
+        # Fix timestamp issues
+        cmd.extend([
+            '-fflags', '+genpts',           # Generate presentation timestamps
+            '-avoid_negative_ts', 'make_zero',  # Fix negative timestamps
+        ])
+        
+        cmd.extend(['-y', output_file])
+        
+        return self.execute_ffmpeg(cmd, job)
+
+    def execute_ffmpeg(self, cmd, job=None):
+        self.log(f"Running FFmpeg...")
+        
+        # Execute FFmpeg command
+        return self._try_ffmpeg(cmd, self._startupinfo(), job)
+    
+    def _try_ffmpeg(self, cmd, startupinfo, job=None):
+        """Try to execute FFmpeg command and return success status"""
+        with self.metrics.timer('ffmpeg'):
+            success = self._run_ffmpeg(cmd, startupinfo, job)
+        self.metrics.incr('ffmpeg_runs')
+        if not success:
+            self.metrics.incr('ffmpeg_failures')
+        return success
+
+    def _run_ffmpeg(self, cmd, startupinfo, job=None):
+        if not self.is_running:
+            return False
+        # Machine-readable progress on stdout instead of scraping the stats line
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+        process = subprocess.Popen(
+            cmd, 
+            stdin=subprocess.PIPE,  # lets a cancel ask ffmpeg to quit with 'q'
+            stdout=subprocess.PIPE, 
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            startupinfo=startupinfo,
+            encoding='utf-8',
+            errors='replace'
+        )
+        with self.lock:
+            self.processes.add(process)
+
+        # Drain stderr on the side so neither pipe can fill up and block ffmpeg
+        stderr_tail = deque(maxlen=20)
+        def read_stderr():
+            for line in process.stderr:
+                line = line.strip()
+                if line:
+                    stderr_tail.append(line)
+                    if "Error" in line or "error" in line:
+                        self.log(f"FFmpeg: {line}")
+        stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+        stderr_thread.start()
+
+        # Progress lines come through a queue, so a quiet ffmpeg never blocks a cancel
+        lines = queue.Queue()
+        def read_stdout():
+            for line in process.stdout:
+                lines.put(line)
+        stdout_thread = threading.Thread(target=read_stdout, daemon=True)
+        stdout_thread.start()
+
+        tracker = FfmpegProgress(job.duration if job is not None else 0)
+        last_report = 0.0
+        exit_code = cpu_seconds = None
+        
+        try:
+            # Read progress blocks
+            while True:
+                if not self.is_running:
+                    stop_process(process)
+                    return False
+
+                try:
+                    line = lines.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    if exit_code is None:
+                        exit_code, cpu_seconds = poll_usage(process)
+                    if exit_code is not None and not stdout_thread.is_alive() and lines.empty():
+                        if cpu_seconds is not None:
+                            self.metrics.incr('ffmpeg_cpu_seconds', cpu_seconds)
+                        break
+                    continue
+
+                if tracker.feed(line) and job is not None:
+                    now = time.monotonic()
+                    # Throttle UI updates to a few per second per output
+                    if now - last_report >= PROGRESS_INTERVAL or tracker.finished:
+                        last_report = now
+                        job.progress = tracker.fraction
+                        self._emit_job_progress(job.index, tracker.fraction, tracker.eta)
+
+            stderr_thread.join(timeout=5)
+            if process.returncode != 0 and stderr_tail:
+                self.log(f"FFmpeg exited with code {process.returncode}: {stderr_tail[-1]}")
+            return process.returncode == 0
+        finally:
+            try:
+                process.stdin.close()
+            except (OSError, ValueError):
+                pass
+            with self.lock:
+                self.processes.discard(process)
@@ -0,0 +1,41 @@
+import threading
+from collections import deque
+
+
+class LogBuffer:
+    """Thread-safe, bounded log sink.
+
+    Worker threads append messages; the UI drains whatever is pending on a
+    timer and renders it in one go. Memory stays bounded: only the last
+    `max_pending` undrained messages are kept and older ones are counted as
+    dropped, and `history` keeps the last `max_history` lines for export.
+    """
+
+    def __init__(self, max_pending=2000, max_history=5000):
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=max_pending)
+        self.history = deque(maxlen=max_history)
+        self.dropped = 0
+
+    def append(self, message):
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(message)
+            self.history.append(message)
+
+    def drain(self):
+        """Return and clear the pending messages (with a note if some were dropped)"""
+        with self.lock:
+            if not self.pending:
+                return []
+            messages = list(self.pending)
+            self.pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            messages.insert(0, f"... {dropped} log lines skipped ...")
+        return messages
+
+    def lines(self):
+        with self.lock:
+            return list(self.history)
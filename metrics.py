@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Thread-safe counters and stage timers.
+
+    Counters are plain totals (files probed, cache hits, bytes written...).
+    Timers record how often a stage ran and how long it took in total and at
+    most. `snapshot()` returns everything as a dict; it can be written as a
+    JSON line or as Prometheus text.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}  # name -> [count, total seconds, max seconds]
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def update(self, other):
+        """Add another Metrics' counters and timers into this one"""
+        snap = other.snapshot()
+        with self.lock:
+            for name, value in snap['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, t in snap['timers'].items():
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += t['count']
+                timer[1] += t['total_sec']
+                timer[2] = max(timer[2], t['max_sec'])
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {
+                    name: {'count': t[0], 'total_sec': t[1], 'max_sec': t[2]}
+                    for name, t in self.timers.items()
+                },
+            }
+
+    def summary(self):
+        """One-line human readable summary of the stage timers"""
+        snap = self.snapshot()
+        parts = [f"{name} {t['total_sec']:.2f}s" for name, t in sorted(snap['timers'].items())]
+        return ", ".join(parts)
+
+    def to_json_line(self, **labels):
+        record = {'timestamp': time.time()}
+        record.update(labels)
+        record.update(self.snapshot())
+        return json.dumps(record, sort_keys=True)
+
+    def to_prometheus(self, prefix='rvj', **labels):
+        label_text = ""
+        if labels:
+            label_text = "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in sorted(labels.items())) + "}"
+        snap = self.snapshot()
+        lines = []
+        for name, value in sorted(snap['counters'].items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{label_text} {value}")
+        for name, t in sorted(snap['timers'].items()):
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_count{label_text} {t['count']}")
+            lines.append(f"{metric}_sum{label_text} {t['total_sec']:.6f}")
+            lines.append(f"{prefix}_{name}_max_seconds{label_text} {t['max_sec']:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, **labels):
+        """Export to `path`: Prometheus text for .prom/.txt files (replaced),
+        otherwise one JSON line appended per call."""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if path.lower().endswith(('.prom', '.txt')):
+            temp_path = path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus(**labels))
+            os.replace(temp_path, path)
+        else:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(self.to_json_line(**labels) + "\n")
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Before Python 3.12 a cProfile profile only sees its own thread; from 3.12 it
+# sees every thread, but only one profile can be active in the process
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+class Profiler:
+    """Opt-in cProfile hook for a batch.
+
+    Each wrapped call gets its own profile and `dump` merges them. Calls on
+    worker threads (render jobs) are wrapped with wrap_worker(), which only
+    profiles them separately where the batch's profile cannot see them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.skipped = 0   # calls run unprofiled because another profiler was active
+
+    def wrap(self, func):
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # "Another profiling tool is already active" (Python 3.12+)
+                with self.lock:
+                    self.skipped += 1
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    self.profiles.append(profile)
+        return profiled
+
+    def wrap_worker(self, func):
+        return self.wrap(func) if PER_THREAD_PROFILES else func
+
+    def dump(self, path):
+        """Write merged pstats data to `path` (read it with pstats or snakeviz)"""
+        with self.lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return False
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        return True
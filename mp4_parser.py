@@ -0,0 +1,285 @@
+"""
+Minimal ISO-BMFF (MP4/MOV) reader.
+
+Reads only the box headers needed to get duration, per-track timescales and
+codec fourcc, seeking over everything else (mdat is never read). For H.264
+and HEVC the codec profile and pixel format (chroma format and bit depth)
+come from the avcC/hvcC decoder configuration. Returns None for fragmented
+or unusual files so the caller can fall back to ffprobe.
+"""
+
+import os
+import struct
+
+# Boxes we descend into on the way to mdhd/hdlr/stsd
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+# How much of a leaf box we are willing to read
+MAX_LEAF_READ = 256
+# stsd holds the decoder configuration (avcC with its SPS), so allow more
+MAX_STSD_READ = 2048
+
+# Size of a VisualSampleEntry before its child boxes (avcC, hvcC, ...)
+VISUAL_SAMPLE_ENTRY_SIZE = 86
+
+# Profile names as ffprobe reports them
+H264_PROFILES = {
+    44: 'CAVLC 4:4:4', 66: 'Baseline', 77: 'Main', 88: 'Extended', 100: 'High',
+    110: 'High 10', 122: 'High 4:2:2', 244: 'High 4:4:4 Predictive',
+}
+HEVC_PROFILES = {1: 'Main', 2: 'Main 10', 3: 'Main Still Picture', 4: 'Rext'}
+
+# H.264 profiles whose SPS carries chroma_format_idc and bit depths
+H264_HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+
+
+class Mp4Track:
+    def __init__(self):
+        self.track_id = 0
+        self.handler = ''       # 'vide', 'soun', ...
+        self.timescale = 0
+        self.duration = 0       # in track timescale units
+        self.fourcc = ''        # 'avc1', 'hvc1', 'mp4a', ...
+        self.width = 0
+        self.height = 0
+        self.sample_count = 0
+        self.channels = 0
+        self.sample_rate = 0
+        self.profile = ''       # codec profile, e.g. 'High' ('' if unknown)
+        self.pix_fmt = ''       # e.g. 'yuv420p', 'yuv420p10le' ('' if unknown)
+
+    @property
+    def duration_sec(self):
+        return self.duration / self.timescale if self.timescale else 0.0
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class Mp4Info:
+    def __init__(self, timescale, duration, tracks):
+        self.timescale = timescale
+        self.duration_units = duration
+        self.tracks = tracks
+
+    @property
+    def duration(self):
+        """Movie duration in seconds"""
+        return self.duration_units / self.timescale if self.timescale else 0.0
+
+    def to_dict(self):
+        return {
+            'timescale': self.timescale,
+            'duration': self.duration,
+            'tracks': [t.to_dict() for t in self.tracks],
+        }
+
+
+def _iter_boxes(f, start, end):
+    """Yield (type, payload_offset, payload_size) for boxes between start and end"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size:
+            # Corrupt box, stop rather than loop forever
+            return
+        yield box_type, pos + header_size, size - header_size
+        pos += size
+
+
+def _read(f, offset, size, limit=MAX_LEAF_READ):
+    f.seek(offset)
+    return f.read(min(size, limit))
+
+
+def pixel_format(chroma_format, bit_depth):
+    """ffmpeg pix_fmt name for a chroma_format_idc and luma bit depth"""
+    base = {0: 'gray', 1: 'yuv420p', 2: 'yuv422p', 3: 'yuv444p'}.get(chroma_format)
+    if base is None:
+        return ''
+    if bit_depth == 8:
+        return base
+    return f"{base}{bit_depth}le" if chroma_format else f"gray{bit_depth}le"
+
+
+class _BitReader:
+    """Reads bits and Exp-Golomb codes from an H.264 NAL unit payload"""
+
+    def __init__(self, data):
+        # Drop emulation prevention bytes (00 00 03 -> 00 00)
+        self.data = data.replace(b'\x00\x00\x03', b'\x00\x00')
+        self.pos = 0
+
+    def bit(self):
+        byte = self.data[self.pos >> 3]  # IndexError past the end
+        value = (byte >> (7 - (self.pos & 7))) & 1
+        self.pos += 1
+        return value
+
+    def ue(self):
+        zeros = 0
+        while not self.bit():
+            zeros += 1
+            if zeros > 31:
+                raise ValueError("bad Exp-Golomb code")
+        value = 0
+        for _ in range(zeros):
+            value = (value << 1) | self.bit()
+        return (1 << zeros) - 1 + value
+
+
+def _parse_avcc(data, track):
+    # configurationVersion, profile, compatibility, level, lengthSizeMinusOne, numOfSPS
+    if len(data) < 8 or not data[5] & 0x1f:
+        return
+    sps_length = struct.unpack_from('>H', data, 6)[0]
+    sps = data[8:8 + sps_length]
+    if len(sps) < 4:
+        return
+    # NAL header, profile_idc, constraint flags, level_idc
+    profile_idc, constraints = sps[1], sps[2]
+    name = H264_PROFILES.get(profile_idc, str(profile_idc))
+    if profile_idc == 66 and constraints & 0x40:
+        name = 'Constrained Baseline'
+    track.profile = name
+    if profile_idc not in H264_HIGH_PROFILES:
+        # Lower profiles are always 8-bit 4:2:0
+        track.pix_fmt = 'yuv420p'
+        return
+    try:
+        bits = _BitReader(sps[4:])
+        bits.ue()  # seq_parameter_set_id
+        chroma_format = bits.ue()
+        if chroma_format == 3:
+            bits.bit()  # separate_colour_plane_flag
+        track.pix_fmt = pixel_format(chroma_format, bits.ue() + 8)
+    except (IndexError, ValueError):
+        pass
+
+
+def _parse_hvcc(data, track):
+    # configurationVersion(1) profile_space/tier/profile_idc(1) compatibility(4) constraints(6)
+    # level(1) min_spatial_segmentation(2) parallelismType(1) chromaFormat(1) bitDepthLumaMinus8(1)
+    if len(data) < 18:
+        return
+    profile_idc = data[1] & 0x1f
+    track.profile = HEVC_PROFILES.get(profile_idc, str(profile_idc))
+    track.pix_fmt = pixel_format(data[16] & 0x03, (data[17] & 0x07) + 8)
+
+
+def _parse_mvhd(data):
+    version = data[0]
+    if version == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', data, 12)
+    return timescale, duration
+
+
+def _parse_tkhd(data, track):
+    version = data[0]
+    if version == 1:
+        track.track_id = struct.unpack_from('>I', data, 20)[0]
+        wh_offset = 4 + 8 + 8 + 4 + 4 + 8 + 8 + 2 + 2 + 2 + 2 + 36
+    else:
+        track.track_id = struct.unpack_from('>I', data, 12)[0]
+        wh_offset = 4 + 4 + 4 + 4 + 4 + 4 + 8 + 2 + 2 + 2 + 2 + 36
+    if len(data) >= wh_offset + 8:
+        width, height = struct.unpack_from('>II', data, wh_offset)
+        track.width = width >> 16
+        track.height = height >> 16
+
+
+def _parse_stsd(data, track):
+    # version/flags(4) entry_count(4) then first sample entry: size(4) format(4)
+    if len(data) < 16:
+        return
+    track.fourcc = data[12:16].decode('latin-1')
+    entry = data[16:]
+    if track.handler == 'vide' and len(entry) >= 28:
+        # reserved(6) data_ref(2) pre_defined/reserved(16) width(2) height(2)
+        width, height = struct.unpack_from('>HH', entry, 24)
+        track.width = track.width or width
+        track.height = track.height or height
+        children = 16 + VISUAL_SAMPLE_ENTRY_SIZE - 8
+        entry_end = min(len(data), 8 + struct.unpack_from('>I', data, 8)[0])
+        pos = children
+        while pos + 8 <= entry_end:
+            size, box_type = struct.unpack_from('>I4s', data, pos)
+            if size < 8:
+                break
+            if box_type == b'avcC':
+                _parse_avcc(data[pos + 8:pos + size], track)
+            elif box_type == b'hvcC':
+                _parse_hvcc(data[pos + 8:pos + size], track)
+            pos += size
+    elif track.handler == 'soun' and len(entry) >= 28:
+        # reserved(6) data_ref(2) reserved(8) channels(2) sample_size(2) pre_defined(2) reserved(2) rate(4)
+        track.channels = struct.unpack_from('>H', entry, 16)[0]
+        track.sample_rate = struct.unpack_from('>I', entry, 24)[0] >> 16
+
+
+def _walk_trak(f, start, end, track):
+    for box_type, offset, size in _iter_boxes(f, start, end):
+        if box_type == b'tkhd':
+            _parse_tkhd(_read(f, offset, size), track)
+        elif box_type == b'mdhd':
+            track.timescale, track.duration = _parse_mvhd(_read(f, offset, size))
+        elif box_type == b'hdlr':
+            data = _read(f, offset, size)
+            track.handler = data[8:12].decode('latin-1')
+        elif box_type == b'stsd':
+            _parse_stsd(_read(f, offset, size, MAX_STSD_READ), track)
+        elif box_type == b'stsz':
+            data = _read(f, offset, size)
+            track.sample_count = struct.unpack_from('>I', data, 8)[0]
+        elif box_type in CONTAINER_BOXES:
+            _walk_trak(f, offset, offset + size, track)
+
+
+def read_mp4_info(file_path):
+    """Parse an MP4/MOV header. Returns Mp4Info, or None if the file needs ffprobe."""
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            moov = None
+            for box_type, offset, size in _iter_boxes(f, 0, file_size):
+                if box_type == b'moov':
+                    moov = (offset, size)
+                elif box_type == b'moof':
+                    # Fragmented file: mvhd duration does not cover the fragments
+                    return None
+            if moov is None:
+                return None
+
+            timescale = duration = 0
+            tracks = []
+            moov_start, moov_size = moov
+            for box_type, offset, size in _iter_boxes(f, moov_start, moov_start + moov_size):
+                if box_type == b'mvhd':
+                    timescale, duration = _parse_mvhd(_read(f, offset, size))
+                elif box_type == b'mvex':
+                    return None
+                elif box_type == b'trak':
+                    track = Mp4Track()
+                    _walk_trak(f, offset, offset + size, track)
+                    tracks.append(track)
+
+            if not timescale or not duration:
+                return None
+            return Mp4Info(timescale, duration, tracks)
+    except (OSError, struct.error, IndexError):
+        return None
@@ -0,0 +1,133 @@
+"""
+Normalized-clip cache.
+
+Clips whose stream format differs from the library's main format (the
+largest bucket) are encoded once to that format and kept in a
+content-addressed cache, capped by disk size with LRU eviction. Once a clip
+has a normalized copy, the VideoManager moves it into the main bucket and
+renders use the copy, so stream-copy concat works for it too.
+"""
+
+import os
+import hashlib
+import threading
+import subprocess
+import concurrent.futures
+
+from app_paths import get_app_data_dir
+from disk_cache import DiskLRUCache
+from process_control import wait_process
+from probe_cache import quick_content_hash
+from segment_encode import EncodeProfile, default_encode_workers
+from stream_fingerprint import UNKNOWN_FINGERPRINT
+
+DEFAULT_MAX_BYTES = 100 * 1024 ** 3
+
+
+class NormalizeCache(DiskLRUCache):
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        if cache_dir is None:
+            cache_dir = os.path.join(get_app_data_dir(), "normalized")
+        super().__init__(cache_dir, max_bytes, ".mp4")
+
+    @staticmethod
+    def key_for(clip_path, profile):
+        content_hash = quick_content_hash(clip_path)
+        if content_hash is None:
+            return None
+        return hashlib.sha1(f"{content_hash}|{profile.key()}".encode('utf-8')).hexdigest()
+
+    def lookup(self, clip_path, profile):
+        key = self.key_for(clip_path, profile)
+        return self.get(key) if key is not None else None
+
+    def get_normalized(self, clip_path, profile, run_ffmpeg, has_audio=True):
+        """Return the normalized copy of a clip, encoding it on first use.
+        `run_ffmpeg(cmd)` runs a command and returns True on success."""
+        key = self.key_for(clip_path, profile)
+        if key is None:
+            return None
+        return self.get_or_create(
+            key, lambda temp_path: run_ffmpeg(profile.build_command(clip_path, temp_path, has_audio)))
+
+
+class ClipNormalizer:
+    """Fills a NormalizeCache in the background for clips outside the main format.
+
+    Clips are encoded `workers` at a time (one ffmpeg process each); every
+    finished clip is handed to `video_manager.mark_normalized` right away.
+    """
+
+    def __init__(self, video_manager, cache, workers=None, on_log=None, on_finished=None):
+        self.video_manager = video_manager
+        self.cache = cache
+        self.workers = workers or max(1, default_encode_workers() // 2)
+        self.on_log = on_log
+        self.on_finished = on_finished
+        self.is_running = True
+        self.lock = threading.Lock()
+        self.thread = None
+        self.normalized = 0
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+        else:
+            print(message, flush=True)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Returns at once; running encodes are stopped and reaped by their worker threads"""
+        self.is_running = False
+
+    def run_ffmpeg(self, cmd):
+        if not self.is_running:
+            return False
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, startupinfo=startupinfo)
+        try:
+            return wait_process(process, lambda: self.is_running) == 0 and self.is_running
+        finally:
+            process.stdin.close()
+
+    def run(self):
+        """Normalize every clip outside the main format. Returns how many have a normalized copy."""
+        try:
+            target = self.video_manager.target_fingerprint()
+            if target is None:
+                return 0
+            profile = EncodeProfile.from_fingerprint(target)
+            pending = [(path, fp) for path, fp in self.video_manager.clips_outside(target)
+                       if fp != UNKNOWN_FINGERPRINT]
+            if not pending:
+                return 0
+            self.log(f"Normalizing {len(pending)} clip(s) to {profile.key()} in the background...")
+
+            def normalize(item):
+                path, fingerprint = item
+                if not self.is_running:
+                    return
+                cached = self.cache.get_normalized(path, profile, self.run_ffmpeg,
+                                                   has_audio=not fingerprint.endswith('noaudio'))
+                if cached is not None and self.is_running:
+                    self.video_manager.mark_normalized(path, cached, target)
+                    with self.lock:
+                        self.normalized += 1
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(normalize, pending))
+            self.log(f"Normalized {self.normalized}/{len(pending)} clip(s).")
+            return self.normalized
+        except Exception as e:
+            self.log(f"Error normalizing clips: {e}")
+            return self.normalized
+        finally:
+            if self.on_finished:
+                self.on_finished(self.normalized)
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from app_paths import get_app_data_dir
+
+# Bytes read from the head and tail of a file to build its content hash.
+# Enough to tell clips apart without reading whole multi-GB files.
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def file_signature(file_path):
+    """Return (size, mtime) for a file, or None if it can't be stat'ed"""
+    try:
+        st = os.stat(file_path)
+        return st.st_size, st.st_mtime
+    except OSError:
+        return None
+
+
+def quick_content_hash(file_path, size=None):
+    """Hash size + first/last chunk of a file so renamed or moved clips still match"""
+    try:
+        if size is None:
+            size = os.path.getsize(file_path)
+        h = hashlib.sha1(str(size).encode('ascii'))
+        with open(file_path, 'rb') as f:
+            h.update(f.read(HASH_CHUNK_SIZE))
+            if size > HASH_CHUNK_SIZE * 2:
+                f.seek(-HASH_CHUNK_SIZE, os.SEEK_END)
+                h.update(f.read(HASH_CHUNK_SIZE))
+        return h.hexdigest()
+    except OSError:
+        return None
+
+
+class ProbeCache:
+    """Persistent SQLite store of probe results keyed by path + size + mtime"""
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.path.join(get_app_data_dir(), "probe_cache.sqlite3")
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS probe ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " content_hash TEXT,"
+            " duration REAL NOT NULL,"
+            " info TEXT,"
+            " updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS probe_hash ON probe(content_hash)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS probe_size ON probe(size)")
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get(self, file_path, size, mtime):
+        """Return the cached entry dict for a file, or None if missing or stale"""
+        return self.get_many({file_path: (size, mtime)}).get(file_path)
+
+    def get_many(self, signatures):
+        """Bulk lookup. `signatures` maps path -> (size, mtime); only fresh entries are returned"""
+        results = {}
+        paths = list(signatures)
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT path, size, mtime, content_hash, duration, info FROM probe WHERE path IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for path, size, mtime, content_hash, duration, info in rows:
+                    if (size, mtime) == tuple(signatures[path]):
+                        results[path] = self._row_to_entry(content_hash, duration, info)
+        return results
+
+    def get_by_sizes(self, sizes):
+        """Entries under any path with one of these file sizes: size -> list of entry dicts
+        (with 'path' and 'mtime' added), for matching renamed or moved clips"""
+        results = {}
+        sizes = list(sizes)
+        with self.lock:
+            for start in range(0, len(sizes), 500):
+                chunk = sizes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT path, size, mtime, content_hash, duration, info FROM probe WHERE size IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for path, size, mtime, content_hash, duration, info in rows:
+                    entry = self._row_to_entry(content_hash, duration, info)
+                    entry['path'], entry['mtime'] = path, mtime
+                    results.setdefault(size, []).append(entry)
+        return results
+
+    def put(self, file_path, size, mtime, duration, content_hash=None, info=None):
+        self.put_many([(file_path, size, mtime, duration, content_hash, info)])
+
+    def put_many(self, entries):
+        """Store (path, size, mtime, duration, content_hash, info) tuples in one transaction"""
+        now = time.time()
+        rows = [
+            (path, size, mtime, content_hash, duration, json.dumps(info) if info else None, now)
+            for path, size, mtime, duration, content_hash, info in entries
+        ]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO probe (path, size, mtime, content_hash, duration, info, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+
+    def evict(self, paths):
+        with self.lock:
+            self.conn.executemany("DELETE FROM probe WHERE path = ?", [(p,) for p in paths])
+            self.conn.commit()
+
+    def evict_stale(self, max_age_sec=None, folders=None):
+        """Drop entries whose file is gone or changed, and optionally entries older than max_age_sec.
+        With `folders`, only entries under those folders are checked. Returns the number of removed entries."""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, size, mtime, updated FROM probe").fetchall()
+
+        cutoff = time.time() - max_age_sec if max_age_sec else None
+        prefixes = tuple(os.path.join(os.path.normcase(os.path.abspath(f)), '') for f in folders or [])
+        stale = []
+        for path, size, mtime, updated in rows:
+            if prefixes and not os.path.normcase(os.path.abspath(path)).startswith(prefixes):
+                continue
+            if cutoff is not None and updated < cutoff:
+                stale.append(path)
+            elif file_signature(path) != (size, mtime):
+                stale.append(path)
+
+        if stale:
+            self.evict(stale)
+        return len(stale)
+
+    @staticmethod
+    def _row_to_entry(content_hash, duration, info):
+        return {
+            'content_hash': content_hash,
+            'duration': duration,
+            'info': json.loads(info) if info else {},
+        }
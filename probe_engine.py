@@ -0,0 +1,312 @@
+"""
+Asyncio probe engine.
+
+Probes many files at once without a thread per ffprobe. MP4/MOV headers are
+parsed natively (in the event loop's executor); everything else gets a
+single `ffprobe -of json` call that asks only for the fields the library
+uses (duration, bit rates, stream codecs and layout).
+
+Concurrency adapts to the storage: each stage (native reads, ffprobe) has a
+limit that follows a gradient controller - it grows while probe latency
+stays near the best seen and shrinks when probes start queueing on a busy
+disk or share. It does not grow while the CPU is saturated. Timeouts and
+I/O errors are retried with exponential backoff, and every file gets a
+ProbeResult that says what happened.
+"""
+
+import os
+import json
+import math
+import time
+import signal
+import random
+import asyncio
+import subprocess
+
+from mp4_parser import read_mp4_info
+from stream_fingerprint import info_from_ffprobe
+
+# Containers the native header parser understands
+NATIVE_PARSE_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+# Failure reasons
+MISSING = 'missing'              # file is gone or cannot be opened
+TIMEOUT = 'timeout'              # ffprobe did not answer in time
+IO_ERROR = 'io_error'            # read error, often a flaky network share
+FFPROBE_ERROR = 'ffprobe_error'  # ffprobe rejected the file
+BAD_OUTPUT = 'bad_output'        # ffprobe printed something other than the expected JSON
+NO_DURATION = 'no_duration'      # readable, but nothing to play
+NO_FFPROBE = 'no_ffprobe'        # ffprobe is not installed or not on PATH
+
+# Worth another attempt
+RETRYABLE = {TIMEOUT, IO_ERROR}
+# Will not change until the file does, so they can be cached
+PERMANENT = {FFPROBE_ERROR, BAD_OUTPUT, NO_DURATION}
+
+FFPROBE_ENTRIES = ("format=duration,bit_rate"
+                   ":stream=codec_type,codec_name,profile,pix_fmt,time_base,avg_frame_rate,r_frame_rate,"
+                   "width,height,channels,sample_rate,bit_rate"
+                   ":stream_disposition=attached_pic")
+
+IO_ERROR_MARKERS = ('Input/output error', 'Resource temporarily unavailable',
+                    'Stale file handle', 'Connection timed out')
+
+# Seconds to wait for a killed ffprobe to exit
+REAP_TIMEOUT = 2.0
+
+# Load average per core above which the limits stop growing
+CPU_SATURATED_LOAD = 1.0
+
+
+class ProbeResult:
+    """What probing one file gave: duration and info, or an `error` reason from above"""
+
+    def __init__(self, path, duration=None, info=None, source=None, error=None, detail="",
+                 attempts=0, elapsed=0.0):
+        self.path = path
+        self.duration = duration
+        self.info = info
+        self.source = source    # 'native', 'ffprobe' or 'cache'
+        self.error = error
+        self.detail = detail    # e.g. ffprobe's last stderr line
+        self.attempts = attempts
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return f"ProbeResult({self.path!r}, {self.duration:.2f}s via {self.source})"
+        return f"ProbeResult({self.path!r}, {self.error}: {self.detail})"
+
+
+_cpu_check = {'time': 0.0, 'saturated': False}
+
+
+def cpu_saturated():
+    """True while the load average is at or above the core count (checked once a second)"""
+    now = time.monotonic()
+    if now - _cpu_check['time'] >= 1.0:
+        _cpu_check['time'] = now
+        try:
+            _cpu_check['saturated'] = os.getloadavg()[0] >= (os.cpu_count() or 1) * CPU_SATURATED_LOAD
+        except (AttributeError, OSError):
+            # No load average on Windows; rely on latency alone
+            _cpu_check['saturated'] = False
+    return _cpu_check['saturated']
+
+
+class AdaptiveLimit:
+    """Concurrency limit driven by latency (a simplified gradient controller).
+
+    After each probe the limit moves towards limit * best / recent + sqrt(limit):
+    it keeps growing while latency stays close to the best seen, and backs off
+    once requests queue up. Timeouts and I/O errors halve it.
+    """
+
+    def __init__(self, initial, minimum, maximum, smoothing=0.2):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(maximum, initial)))
+        self.smoothing = smoothing
+        self.best_latency = None
+        self.recent_latency = None
+
+    @property
+    def value(self):
+        return int(self.limit)
+
+    def update(self, latency):
+        if latency <= 0:
+            return
+        self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+        if self.recent_latency is None:
+            self.recent_latency = latency
+        else:
+            self.recent_latency += self.smoothing * (latency - self.recent_latency)
+
+        gradient = max(0.5, min(1.0, self.best_latency / self.recent_latency))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        if target > self.limit and cpu_saturated():
+            target = self.limit
+        self.limit += self.smoothing * (target - self.limit)
+        self.limit = max(self.minimum, min(self.maximum, self.limit))
+
+    def backoff(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class _Gate:
+    """Async context manager that admits up to `limit.value` holders at a time"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < max(1, self.limit.value))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+def _read_native(path):
+    """(Mp4Info or None, missing) for an MP4/MOV file"""
+    if not os.path.isfile(path):
+        return None, True
+    return read_mp4_info(path), False
+
+
+def _kill(process):
+    try:
+        if os.name == 'nt':
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ProbeEngine:
+    """Probes files concurrently; see the module docstring.
+
+    The limits are kept between calls, so later scans start from what the
+    storage managed before.
+    """
+
+    def __init__(self, min_workers=2, max_workers=None, timeout=10.0, retries=2, backoff=0.5,
+                 ffprobe='ffprobe', native=True):
+        cpus = os.cpu_count() or 1
+        self.max_workers = max_workers or min(64, cpus * 4)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.ffprobe = ffprobe
+        self.native = native
+        self.limits = {
+            'native': AdaptiveLimit(min(self.max_workers, 8), min_workers, self.max_workers),
+            'ffprobe': AdaptiveLimit(min(self.max_workers, cpus), min_workers, self.max_workers),
+        }
+
+    def probe(self, path):
+        return self.probe_many([path])[path]
+
+    def probe_many(self, paths):
+        """Probe files concurrently and return {path: ProbeResult}.
+        Runs its own event loop, so call it from a thread without one."""
+        paths = list(dict.fromkeys(paths))
+        if not paths:
+            return {}
+        return asyncio.run(self.probe_all(paths))
+
+    async def probe_all(self, paths):
+        gates = {stage: _Gate(limit) for stage, limit in self.limits.items()}
+        results = {}
+        pending = iter(paths)
+
+        async def worker():
+            # The gates decide how many of these actually probe at once
+            for path in pending:
+                results[path] = await self._probe_one(path, gates)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.max_workers, len(paths)))))
+        return results
+
+    async def _probe_one(self, path, gates):
+        start = time.perf_counter()
+        result = ProbeResult(path)
+
+        if self.native and path.lower().endswith(NATIVE_PARSE_EXTENSIONS):
+            loop = asyncio.get_running_loop()
+            async with gates['native']:
+                read_start = time.perf_counter()
+                mp4_info, missing = await loop.run_in_executor(None, _read_native, path)
+                self.limits['native'].update(time.perf_counter() - read_start)
+            if missing:
+                result.error, result.detail = MISSING, "file not found"
+                result.elapsed = time.perf_counter() - start
+                return result
+            if mp4_info is not None:
+                result.duration, result.info, result.source = mp4_info.duration, mp4_info.to_dict(), 'native'
+                result.elapsed = time.perf_counter() - start
+                return result
+
+        # Fragmented, non-MP4 or unusual files
+        result.source = 'ffprobe'
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            async with gates['ffprobe']:
+                run_start = time.perf_counter()
+                # A slow share gets more time on each retry
+                error, detail, info = await self._run_ffprobe(path, self.timeout * 2 ** attempt)
+                if error in RETRYABLE:
+                    self.limits['ffprobe'].backoff()
+                else:
+                    self.limits['ffprobe'].update(time.perf_counter() - run_start)
+            result.attempts = attempt + 1
+            if error not in RETRYABLE:
+                break
+
+        result.error, result.detail = error, detail
+        if error is None:
+            result.duration, result.info = info['duration'], info
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    async def _run_ffprobe(self, path, timeout):
+        """Run one ffprobe. Returns (error, detail, info)."""
+        cmd = [self.ffprobe, '-v', 'error', '-show_entries', FFPROBE_ENTRIES, '-of', 'json', path]
+        kwargs = {}
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            kwargs['startupinfo'] = startupinfo
+        else:
+            # Own process group, so a timeout can kill anything it started too
+            kwargs['start_new_session'] = True
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+        except FileNotFoundError:
+            return NO_FFPROBE, f"{self.ffprobe} not found", None
+        except OSError as e:
+            # Out of processes or file handles: back off and retry
+            return IO_ERROR, str(e), None
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            _kill(process)
+            try:
+                await asyncio.wait_for(process.wait(), REAP_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return TIMEOUT, f"no answer in {timeout:.0f}s", None
+
+        lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+        last_line = lines[-1] if lines else ""
+        if process.returncode != 0:
+            if not os.path.exists(path):
+                return MISSING, "file not found", None
+            if any(marker in last_line for marker in IO_ERROR_MARKERS):
+                return IO_ERROR, last_line, None
+            return FFPROBE_ERROR, last_line or f"exit code {process.returncode}", None
+
+        try:
+            info = info_from_ffprobe(json.loads(stdout))
+        except (ValueError, TypeError, AttributeError) as e:
+            return BAD_OUTPUT, str(e), None
+        if info['duration'] <= 0:
+            return NO_DURATION, "no duration", None
+        return None, "", info
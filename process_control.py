@@ -0,0 +1,79 @@
+"""
+Stopping ffmpeg without hanging or leaving processes behind.
+
+stop_process() first asks ffmpeg to quit ('q' on stdin, so it can close its
+output cleanly), then terminates it and finally kills it, waiting a bounded
+time after each step. The process is always reaped, so no zombies are left.
+"""
+
+import io
+import os
+import subprocess
+
+GRACEFUL_TIMEOUT = 2.0
+TERMINATE_TIMEOUT = 3.0
+KILL_TIMEOUT = 5.0
+
+# How often running ffmpeg loops check whether they were cancelled (seconds)
+POLL_INTERVAL = 0.1
+
+
+def stop_process(process, graceful_timeout=GRACEFUL_TIMEOUT, terminate_timeout=TERMINATE_TIMEOUT):
+    """Stop and reap `process` (started with stdin=PIPE for the graceful step).
+    Returns its exit code, or None if it would not exit even after kill()."""
+    if process.poll() is not None:
+        return process.returncode
+
+    def ask_to_quit():
+        if process.stdin is None or process.stdin.closed:
+            return
+        process.stdin.write('q' if isinstance(process.stdin, io.TextIOBase) else b'q')
+        process.stdin.flush()
+        process.stdin.close()
+
+    steps = [
+        (ask_to_quit, graceful_timeout),
+        (process.terminate, terminate_timeout),
+        (process.kill, KILL_TIMEOUT),
+    ]
+    for action, timeout in steps:
+        try:
+            action()
+        except (OSError, ValueError):
+            # Broken pipe, or already gone
+            pass
+        try:
+            return process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            continue
+    return None
+
+
+def poll_usage(process):
+    """Like process.poll(), but reaps with os.wait4 so the CPU time of this one
+    process is known. Returns (exit code, CPU seconds) once it has exited, else
+    (None, None); CPU seconds are None where unknown (Windows, or reaped elsewhere)."""
+    if process.returncode is not None or not hasattr(os, 'wait4'):
+        return process.poll(), None
+    try:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+    except ChildProcessError:
+        # Reaped by a concurrent wait()
+        return process.poll(), None
+    if pid == 0:
+        return None, None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, usage.ru_utime + usage.ru_stime
+
+
+def wait_process(process, should_continue, poll_interval=POLL_INTERVAL):
+    """Wait for `process` to exit, stopping it as soon as should_continue() turns False.
+    Returns the exit code, or None if it was stopped."""
+    while True:
+        try:
+            return process.wait(poll_interval)
+        except subprocess.TimeoutExpired:
+            pass
+        if not should_continue():
+            stop_process(process)
+            return None
@@ -0,0 +1,241 @@
+"""
+Render time and output size estimates.
+
+A dry-run plan (the clip cycle is left untouched) gives each output's clips;
+a stream-copied output is about as large as its clips put together. Run
+time comes from a throughput model fitted to the batches this machine has
+rendered: every finished batch records how much it got through (bytes for
+stream copy, seconds of video for re-encodes), in how much wall time, with
+how many jobs running at once.
+
+Aggregate throughput with k jobs is modelled with Amdahl's law,
+A(k) = k * r / (1 + s * (k - 1)), where r is one job's throughput and s the
+share of the work that does not parallelize (usually the disk). Settings
+that were actually measured use their measured throughput.
+"""
+
+import os
+import json
+import time
+import platform
+import threading
+
+from app_paths import get_app_data_dir
+from render_scheduler import RenderJob, RenderScheduler, default_max_jobs, free_bytes
+from selection_planner import DEFAULT_TOLERANCE_SEC, plan_batch
+
+MODEL_FILE = "throughput_model.json"
+MAX_SAMPLES = 50
+
+# Per-job throughput and serial share until this machine has rendered
+# something: bytes/s for stream copy, seconds of video per second for re-encodes
+DEFAULT_RATES = {'copy': 150 * 1024 ** 2, 'reencode': 2.0}
+DEFAULT_SERIAL = {'copy': 0.5, 'reencode': 0.6}
+
+# The recommended job count is the smallest one within this share of the fastest
+BEST_JOBS_SLACK = 0.05
+
+
+def throughput_mode(encode_mode):
+    return 'reencode' if encode_mode == 'always' else 'copy'
+
+
+class ThroughputModel:
+    """Per-machine record of past batches, saved as JSON in the app data folder"""
+
+    def __init__(self, path=None, machine=None):
+        self.path = path or os.path.join(get_app_data_dir(), MODEL_FILE)
+        self.machine = machine or platform.node() or "default"
+        self.lock = threading.Lock()
+        self.samples = self._load().get(self.machine, {})  # mode -> list of batches
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        # The file may be shared by several machines (e.g. a roaming profile)
+        data = self._load()
+        data[self.machine] = self.samples
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not save throughput model: {e}")
+
+    def record(self, mode, jobs, wall_sec, bytes_done, seconds_done):
+        """Add a finished batch: `jobs` ran at once and got through the given work in `wall_sec`"""
+        if jobs < 1 or wall_sec <= 0:
+            return
+        with self.lock:
+            samples = self.samples.setdefault(mode, [])
+            samples.append({
+                'time': int(time.time()),
+                'jobs': int(jobs),
+                'wall': wall_sec,
+                'bytes': bytes_done,
+                'seconds': seconds_done,
+            })
+            del samples[:-MAX_SAMPLES]
+            self._save()
+
+    def measured(self, mode):
+        """Aggregate throughput measured per job count: {jobs: work per second}"""
+        unit = 'bytes' if mode == 'copy' else 'seconds'
+        totals = {}
+        with self.lock:
+            for sample in self.samples.get(mode, []):
+                work, wall = totals.get(sample['jobs'], (0.0, 0.0))
+                totals[sample['jobs']] = (work + sample[unit], wall + sample['wall'])
+        return {k: work / wall for k, (work, wall) in totals.items() if work > 0 and wall > 0}
+
+    def calibrated(self, mode):
+        return bool(self.measured(mode))
+
+    def fit(self, mode):
+        """Return (r, s): one job's throughput and the serial share"""
+        measured = self.measured(mode)
+        if not measured:
+            return DEFAULT_RATES[mode], DEFAULT_SERIAL[mode]
+        if len(measured) >= 2:
+            # k / A(k) = (1 - s) / r + (s / r) * k is a straight line in k
+            xs = sorted(measured)
+            ys = [k / measured[k] for k in xs]
+            mean_x = sum(xs) / len(xs)
+            mean_y = sum(ys) / len(ys)
+            slope = (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+                     / sum((x - mean_x) ** 2 for x in xs))
+            intercept = mean_y - slope * mean_x
+            if intercept + slope > 0:
+                r = 1.0 / (intercept + slope)
+                return r, min(1.0, max(0.0, slope * r))
+        # A single setting says nothing about scaling: keep the default serial share
+        s = DEFAULT_SERIAL[mode]
+        k = max(measured)
+        return measured[k] * (1 + s * (k - 1)) / k, s
+
+    def throughput(self, mode, jobs):
+        """Expected aggregate work per second with `jobs` outputs rendering at once"""
+        measured = self.measured(mode)
+        if jobs in measured:
+            return measured[jobs]
+        r, s = self.fit(mode)
+        return jobs * r / (1 + s * (jobs - 1))
+
+
+class OutputEstimate:
+    def __init__(self, index, clip_count, duration, size):
+        self.index = index
+        self.clip_count = clip_count
+        self.duration = duration  # seconds of video
+        self.size = size          # bytes
+
+
+class BatchEstimate:
+    """Predicted outputs of a batch and its run time for each job count"""
+
+    def __init__(self, outputs, mode, jobs, seconds_by_jobs, calibrated, free_space=None, device_limit=None):
+        self.outputs = outputs
+        self.mode = mode
+        self.jobs = jobs                        # job count the batch would run with
+        self.seconds_by_jobs = seconds_by_jobs  # job count -> predicted wall seconds (reachable counts only)
+        self.calibrated = calibrated            # False: default rates, nothing measured yet
+        self.free_space = free_space            # bytes free in the output folder, if known
+        self.device_limit = device_limit        # jobs_per_device, if it caps the job count
+
+    @property
+    def total_size(self):
+        return sum(o.size for o in self.outputs)
+
+    @property
+    def total_duration(self):
+        return sum(o.duration for o in self.outputs)
+
+    @property
+    def seconds(self):
+        return self.seconds_by_jobs.get(self.jobs, 0.0)
+
+    @property
+    def best_jobs(self):
+        if not self.seconds_by_jobs:
+            return self.jobs
+        fastest = min(self.seconds_by_jobs.values())
+        return min(k for k, t in self.seconds_by_jobs.items() if t <= fastest * (1 + BEST_JOBS_SLACK))
+
+    @property
+    def fits(self):
+        return self.free_space is None or self.total_size <= self.free_space
+
+    def summary(self):
+        lines = [
+            f"{len(self.outputs)} output(s), {self.total_duration / 3600:.1f} h of video, "
+            f"about {self.total_size / 1024 ** 3:.1f} GB",
+            f"About {format_seconds(self.seconds)} with {self.jobs} parallel job(s); "
+            f"best: {self.best_jobs} job(s), about {format_seconds(self.seconds_by_jobs.get(self.best_jobs, 0.0))}",
+        ]
+        if self.device_limit is not None:
+            lines.append(f"At most {self.device_limit} job(s) at once: every output reads or writes "
+                         "the same disk (jobs per disk).")
+        if self.free_space is not None:
+            lines.append(f"Free in output folder: {self.free_space / 1024 ** 3:.1f} GB"
+                         + ("" if self.fits else " - NOT ENOUGH"))
+        if not self.calibrated:
+            lines.append("Times use default rates until a batch has been rendered on this machine.")
+        return "\n".join(lines)
+
+
+def format_seconds(seconds):
+    minutes = int(seconds // 60)
+    if minutes >= 60 * 24:
+        return f"{minutes // (60 * 24)}d {minutes // 60 % 24}h"
+    if minutes >= 60:
+        return f"{minutes // 60}h {minutes % 60}m"
+    if minutes:
+        return f"{minutes}m {int(seconds % 60)}s"
+    return f"{seconds:.0f}s"
+
+
+def estimate_batch(video_manager, target_duration_sec, video_count, model=None, encode_mode='copy',
+                   max_jobs=None, jobs_per_device=2, output_folder=None, scratch_dir=None,
+                   tolerance_sec=DEFAULT_TOLERANCE_SEC, compat_mode='strict'):
+    """Dry-run plan a batch and predict output sizes and run time. Nothing is rendered
+    and the clip cycle is not consumed."""
+    model = model or ThroughputModel()
+    plan = plan_batch(video_manager, target_duration_sec, video_count,
+                      tolerance_sec=tolerance_sec, compat_mode=compat_mode, dry_run=True)
+    planned = [o for o in plan.outputs if o.clips]
+    outputs = [OutputEstimate(o.index, len(o.clips), o.duration, o.size) for o in planned]
+
+    mode = throughput_mode(encode_mode)
+    max_jobs = max_jobs or default_max_jobs()
+    work = sum(o.size for o in outputs) if mode == 'copy' else sum(o.duration for o in outputs)
+    seconds_by_jobs = {}
+    reachable = max_jobs
+    device_limit = None
+    if outputs:
+        # Job counts the scheduler can actually run: no more than there are outputs,
+        # and no more than jobs_per_device when every output uses the same disk
+        jobs = [RenderJob(o.index, os.path.join(output_folder or ".", "estimate.mp4"), o.clips, o.duration, o.sources)
+                for o in planned]
+        most = max(max_jobs, os.cpu_count() or 1)
+        reachable = RenderScheduler(None, max_jobs=most, jobs_per_device=jobs_per_device,
+                                    scratch_dir=scratch_dir).concurrency(jobs)
+        if reachable < min(most, len(jobs)):
+            device_limit = reachable
+        for k in range(1, reachable + 1):
+            seconds_by_jobs[k] = work / model.throughput(mode, k)
+
+    return BatchEstimate(
+        outputs, mode,
+        min(max_jobs, reachable),
+        seconds_by_jobs,
+        model.calibrated(mode),
+        free_space=free_bytes(output_folder) if output_folder else None,
+        device_limit=device_limit,
+    )
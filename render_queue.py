@@ -0,0 +1,337 @@
+"""
+Render queue shared by several machines.
+
+A coordinator plans the outputs of a batch and enqueues them in a SQLite
+database on shared storage; workers on any node claim a job, render it and
+acknowledge it. A claimed job carries a lease that the worker renews while
+rendering. If a worker dies, its lease runs out and the job is handed to
+the next worker, up to `max_attempts` times.
+
+Clip and output paths are stored as planned, so every node must see the
+shared storage under the same paths. How each output is encoded is decided
+when it is planned and stored with the job; caches and scratch folders are
+local to each worker. The database uses a rollback journal
+(not WAL) because WAL does not work across machines on network filesystems.
+"""
+
+import os
+import re
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+from joiner_engine import VideoJoiner
+from render_scheduler import RenderJob
+
+DEFAULT_LEASE_SEC = 120
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class QueuedJob:
+    """A job as claimed from the queue"""
+
+    def __init__(self, job_id, batch, index, output_file, clips, duration, no_audio, attempts, settings=None):
+        self.job_id = job_id
+        self.batch = batch
+        self.index = index
+        self.output_file = output_file
+        self.clips = clips
+        self.duration = duration
+        self.no_audio = no_audio
+        self.attempts = attempts
+        self.settings = settings or {}  # encode_mode, encode_profile, encode_workers, silent_clips
+
+    def to_render_job(self, worker_id=None):
+        job = RenderJob(self.index, self.output_file, self.clips, self.duration)
+        if worker_id is not None:
+            # A job whose lease ran out may still be rendering elsewhere: give every
+            # attempt its own partial file so neither removes or replaces the other's
+            job.part_tag = re.sub(r'[^A-Za-z0-9_-]', '_', f"{worker_id}-{self.attempts}")
+        return job
+
+
+class RenderQueue:
+    """SQLite job broker with leases: enqueue, claim, heartbeat, ack and fail"""
+
+    def __init__(self, db_path, lease_sec=DEFAULT_LEASE_SEC, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_sec = lease_sec
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Autocommit mode; every operation runs in its own BEGIN IMMEDIATE transaction
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " batch TEXT NOT NULL,"
+            " output_index INTEGER NOT NULL,"
+            " output_file TEXT NOT NULL,"
+            " clips TEXT NOT NULL,"
+            " duration REAL NOT NULL,"
+            " no_audio INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"  # queued, running, done, failed
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " lease_until REAL,"
+            " error TEXT,"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id)")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if 'settings' not in columns:
+            # Queues created before render settings were stored
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN settings TEXT")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _transaction(self, func):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self.conn, time.time())
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, batch, jobs, no_audio, job_settings=None):
+        """Add planned RenderJobs under a batch name. `job_settings` maps a job's index to
+        the VideoJoiner options it is rendered with. Returns their queue ids."""
+        job_settings = job_settings or {}
+
+        def insert(conn, now):
+            ids = []
+            for job in jobs:
+                settings = job_settings.get(job.index)
+                cursor = conn.execute(
+                    "INSERT INTO jobs (batch, output_index, output_file, clips, duration, no_audio,"
+                    " status, settings, created, updated) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (batch, job.index, job.output_file, json.dumps(job.clips), job.duration,
+                     int(bool(no_audio)), json.dumps(settings) if settings else None, now, now),
+                )
+                ids.append(cursor.lastrowid)
+            return ids
+        return self._transaction(insert)
+
+    def _expire_leases(self, conn, now):
+        # Jobs of workers that stopped renewing their lease: retry or give up
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'lease expired', worker = NULL, updated = ?"
+            " WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+            (now, now, self.max_attempts),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', error = 'lease expired', worker = NULL, updated = ?"
+            " WHERE status = 'running' AND lease_until < ?",
+            (now, now),
+        )
+
+    def claim(self, worker_id):
+        """Lease the oldest queued job to `worker_id`. Returns a QueuedJob or None."""
+        def take(conn, now):
+            self._expire_leases(conn, now)
+            row = conn.execute(
+                "SELECT id, batch, output_index, output_file, clips, duration, no_audio, attempts, settings"
+                " FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,"
+                " lease_until = ?, updated = ? WHERE id = ?",
+                (worker_id, now + self.lease_sec, now, row[0]),
+            )
+            job_id, batch, index, output_file, clips, duration, no_audio, attempts, settings = row
+            return QueuedJob(job_id, batch, index, output_file, json.loads(clips), duration,
+                             bool(no_audio), attempts + 1, json.loads(settings) if settings else None)
+        return self._transaction(take)
+
+    def heartbeat(self, job_id, worker_id):
+        """Renew a lease. Returns False if the job is no longer ours."""
+        def renew(conn, now):
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated = ?"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (now + self.lease_sec, now, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        return self._transaction(renew)
+
+    def ack(self, job_id, worker_id):
+        def finish(conn, now):
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, updated = ?"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (now, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        return self._transaction(finish)
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        """Give a job back after an error: it is queued again until it runs out of attempts"""
+        def give_back(conn, now):
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND attempts < ? THEN 'queued' ELSE 'failed' END,"
+                " worker = NULL, lease_until = NULL, error = ?, updated = ?"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (int(retry), self.max_attempts, error, now, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        return self._transaction(give_back)
+
+    def release(self, job_id, worker_id):
+        """Put a job back without counting the attempt (worker shutting down)"""
+        def put_back(conn, now):
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), worker = NULL,"
+                " lease_until = NULL, updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (now, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        return self._transaction(put_back)
+
+    def retry_failed(self, batch=None):
+        """Queue failed jobs again with a fresh attempt count. Returns how many."""
+        def requeue(conn, now):
+            query = ("UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, updated = ?"
+                     " WHERE status = 'failed'")
+            params = [now]
+            if batch is not None:
+                query += " AND batch = ?"
+                params.append(batch)
+            return conn.execute(query, params).rowcount
+        return self._transaction(requeue)
+
+    def counts(self, batch=None):
+        """Number of jobs per status"""
+        query = "SELECT status, COUNT(*) FROM jobs"
+        params = ()
+        if batch is not None:
+            query += " WHERE batch = ?"
+            params = (batch,)
+        with self.lock:
+            rows = self.conn.execute(query + " GROUP BY status", params).fetchall()
+        return dict(rows)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class RenderWorker:
+    """Claims jobs from a RenderQueue and renders them one at a time.
+
+    The lease is renewed from a side thread while ffmpeg runs. `run()` returns
+    when the queue is empty (with `exit_when_idle`) or after `stop()`.
+    """
+
+    def __init__(self, queue, worker_id=None, segment_cache=None, poll_interval=5.0,
+                 exit_when_idle=False, scratch_dir=None, on_log=None):
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.segment_cache = segment_cache
+        self.scratch_dir = scratch_dir
+        self.poll_interval = poll_interval
+        self.exit_when_idle = exit_when_idle
+        self.on_log = on_log
+        self.is_running = True
+        self.stop_event = threading.Event()
+        self.joiner = None
+        self.rendered = 0
+        self.failed = 0
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+        else:
+            print(f"[{self.worker_id}] {message}", flush=True)
+
+    def stop(self):
+        self.is_running = False
+        self.stop_event.set()
+        joiner = self.joiner
+        if joiner is not None:
+            joiner.stop()
+
+    def _keep_lease(self, job, lost):
+        interval = max(1.0, self.queue.lease_sec / 3)
+        while not lost.wait(interval):
+            try:
+                if not self.queue.heartbeat(job.job_id, self.worker_id):
+                    # Someone else owns the job now (our lease ran out); stop rendering it
+                    self.log(f"Lost lease on job {job.job_id}")
+                    lost.set()
+                    if self.joiner is not None:
+                        self.joiner.stop()
+            except sqlite3.Error as e:
+                self.log(f"Heartbeat failed: {e}")
+
+    def process(self, job):
+        """Render one claimed job and report the result to the queue"""
+        output_folder = os.path.dirname(job.output_file) or "."
+        os.makedirs(output_folder, exist_ok=True)
+        self.joiner = VideoJoiner(None, 0, job.no_audio, output_folder, 1,
+                                  segment_cache=self.segment_cache, scratch_dir=self.scratch_dir,
+                                  encode_mode=job.settings.get('encode_mode', 'copy'),
+                                  encode_profile=job.settings.get('encode_profile'),
+                                  encode_workers=job.settings.get('encode_workers'),
+                                  on_log=self.log)
+        self.joiner.silent_clips = set(job.settings.get('silent_clips', []))
+        if not self.is_running:
+            self.joiner.stop()
+
+        done = threading.Event()
+        lease_thread = threading.Thread(target=self._keep_lease, args=(job, done), daemon=True)
+        lease_thread.start()
+        try:
+            ok = self.joiner.render_job(job.to_render_job(self.worker_id), should_commit=lambda: not done.is_set())
+        except Exception as e:
+            self.log(f"Error rendering job {job.job_id}: {e}")
+            ok = False
+        finally:
+            lost = done.is_set()
+            done.set()
+            lease_thread.join()
+            self.joiner = None
+
+        if lost:
+            return False
+        if not self.is_running:
+            self.queue.release(job.job_id, self.worker_id)
+            self.log(f"Job {job.job_id} handed back")
+            return False
+        if ok:
+            self.queue.ack(job.job_id, self.worker_id)
+            self.rendered += 1
+            self.log(f"✓ Job {job.job_id} done: {os.path.basename(job.output_file)}")
+        else:
+            self.queue.fail(job.job_id, self.worker_id, "ffmpeg failed")
+            self.failed += 1
+            self.log(f"✗ Job {job.job_id} failed (attempt {job.attempts}/{self.queue.max_attempts})")
+        return ok
+
+    def run(self):
+        """Work until stopped (or until the queue is empty with exit_when_idle)"""
+        self.log("Worker started")
+        while self.is_running:
+            try:
+                job = self.queue.claim(self.worker_id)
+            except sqlite3.Error as e:
+                self.log(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                if self.exit_when_idle:
+                    break
+                self.stop_event.wait(self.poll_interval)
+                continue
+            self.log(f"Claimed job {job.job_id} ({job.batch} #{job.index+1}, attempt {job.attempts})")
+            self.process(job)
+        self.log(f"Worker stopped: {self.rendered} rendered, {self.failed} failed")
+        return self.failed == 0
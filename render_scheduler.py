@@ -0,0 +1,257 @@
+import os
+import time
+import shutil
+import threading
+import contextlib
+import concurrent.futures
+
+
+def _existing_parent(path):
+    path = os.path.abspath(path)
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def device_of(path):
+    """Return an id for the storage device holding `path` (or its nearest existing parent)"""
+    try:
+        return os.stat(_existing_parent(path)).st_dev
+    except OSError:
+        return None
+
+
+def device_name(device):
+    if device is None:
+        return "unknown"
+    try:
+        return f"{os.major(device)}:{os.minor(device)}"
+    except (AttributeError, ValueError):
+        return str(device)
+
+
+def free_bytes(path):
+    """Free space on the device holding `path`, or None if it cannot be determined"""
+    try:
+        return shutil.disk_usage(_existing_parent(path)).free
+    except OSError:
+        return None
+
+
+def estimate_output_bytes(job):
+    """A stream-copied output is about as large as its clips put together"""
+    total = 0
+    for source in job.sources:
+        try:
+            total += os.path.getsize(source)
+        except OSError:
+            pass
+    return total
+
+
+def default_max_jobs(jobs_per_cpu=0.5):
+    return max(1, int((os.cpu_count() or 1) * jobs_per_cpu))
+
+
+class RenderJob:
+    """One planned output: where it goes and which clips it is made of"""
+
+    def __init__(self, index, output_file, clips, duration, sources=None):
+        self.index = index
+        self.output_file = output_file
+        self.clips = clips
+        # Files actually read, fixed at planning time (normalized copies of some clips)
+        self.sources = list(sources) if sources else list(clips)
+        self.part_tag = None     # set by queue workers so each attempt has its own partial file
+        self.duration = duration
+        self.status = 'pending'  # pending, running, done, failed, cancelled
+        self.progress = 0.0
+        self.device = device_of(os.path.dirname(output_file))
+
+
+class DeviceIOStats:
+    """Bytes read/written per device and how long each device had jobs running on it.
+
+    Throughput is bytes over busy wall time, so concurrent jobs on one device
+    are not double counted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}         # device -> jobs currently using it
+        self.busy_since = {}
+        self.busy_seconds = {}
+        self.bytes_read = {}
+        self.bytes_written = {}
+
+    def begin(self, devices):
+        now = time.monotonic()
+        with self.lock:
+            for device in devices:
+                if not self.active.get(device):
+                    self.busy_since[device] = now
+                self.active[device] = self.active.get(device, 0) + 1
+
+    def end(self, devices):
+        now = time.monotonic()
+        with self.lock:
+            for device in devices:
+                self.active[device] -= 1
+                if not self.active[device]:
+                    elapsed = now - self.busy_since.pop(device)
+                    self.busy_seconds[device] = self.busy_seconds.get(device, 0.0) + elapsed
+
+    def add(self, read=None, written=None):
+        """Record {device: bytes} read and written by a finished job"""
+        with self.lock:
+            for device, n in (read or {}).items():
+                self.bytes_read[device] = self.bytes_read.get(device, 0) + n
+            for device, n in (written or {}).items():
+                self.bytes_written[device] = self.bytes_written.get(device, 0) + n
+
+    def throughput(self, device):
+        """(read, write) bytes per second for a device, or None before any job finished on it"""
+        with self.lock:
+            busy = self.busy_seconds.get(device)
+            if not busy:
+                return None
+            return self.bytes_read.get(device, 0) / busy, self.bytes_written.get(device, 0) / busy
+
+    def summary(self):
+        parts = []
+        for device in sorted(self.busy_seconds, key=device_name):
+            rates = self.throughput(device)
+            if rates is None or not any(rates):
+                continue
+            parts.append(f"dev {device_name(device)}: read {rates[0] / 1024 ** 2:.1f} MB/s, "
+                         f"write {rates[1] / 1024 ** 2:.1f} MB/s")
+        return "; ".join(parts)
+
+
+class RenderScheduler:
+    """Runs planned RenderJobs concurrently.
+
+    `run_job(job)` does the actual work and returns True on success. At most
+    `max_jobs` run at once overall and at most `jobs_per_device` touch the
+    same device, counting both the devices a job reads its clips from and
+    the one it writes to (`scratch_dir` when outputs are staged there).
+    """
+
+    def __init__(self, run_job, max_jobs=None, jobs_per_cpu=0.5, jobs_per_device=2,
+                 scratch_dir=None, on_job_started=None, on_job_finished=None):
+        self.run_job = run_job
+        self.max_jobs = max_jobs or default_max_jobs(jobs_per_cpu)
+        self.jobs_per_device = jobs_per_device
+        self.scratch_device = device_of(scratch_dir) if scratch_dir else None
+        self.on_job_started = on_job_started
+        self.on_job_finished = on_job_finished
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.device_slots = {}
+        self.folder_devices = {}
+        self.io_stats = DeviceIOStats()
+        self.running = 0
+        self.peak_running = 0  # most jobs that actually ran at once (device caps included)
+
+    def _device_slot(self, device):
+        with self.lock:
+            if device not in self.device_slots:
+                limit = self.jobs_per_device or self.max_jobs
+                self.device_slots[device] = threading.Semaphore(limit)
+            return self.device_slots[device]
+
+    def _folder_device(self, folder):
+        with self.lock:
+            if folder not in self.folder_devices:
+                self.folder_devices[folder] = device_of(folder)
+            return self.folder_devices[folder]
+
+    def read_bytes(self, job):
+        """{device: bytes} of the clips a job reads"""
+        per_device = {}
+        for source in job.sources:
+            try:
+                size = os.path.getsize(source)
+            except OSError:
+                continue
+            device = self._folder_device(os.path.dirname(source))
+            per_device[device] = per_device.get(device, 0) + size
+        return per_device
+
+    def write_device(self, job):
+        return self.scratch_device if self.scratch_device is not None else job.device
+
+    def job_devices(self, job, read=None):
+        devices = set(self.read_bytes(job) if read is None else read)
+        devices.add(self.write_device(job))
+        return devices
+
+    def concurrency(self, jobs):
+        """Most of `jobs` that can run at once: max_jobs, or jobs_per_device when
+        every job uses the same device (e.g. everything on one disk)"""
+        limit = min(self.max_jobs, len(jobs))
+        if not jobs or not self.jobs_per_device:
+            return limit
+        shared = set.intersection(*(self.job_devices(job) for job in jobs))
+        return min(limit, self.jobs_per_device) if shared else limit
+
+    def cancel_all(self):
+        self.cancelled.set()
+
+    def _run_one(self, job):
+        if self.cancelled.is_set():
+            job.status = 'cancelled'
+            return job
+
+        read = self.read_bytes(job)
+        devices = self.job_devices(job, read)
+        # Take device slots in a fixed order so jobs sharing devices cannot deadlock
+        devices = sorted(devices, key=lambda d: (d is None, d or 0))
+        with contextlib.ExitStack() as stack:
+            for device in devices:
+                stack.enter_context(self._device_slot(device))
+            if self.cancelled.is_set():
+                job.status = 'cancelled'
+                return job
+
+            job.status = 'running'
+            if self.on_job_started:
+                self.on_job_started(job)
+            self.io_stats.begin(devices)
+            with self.lock:
+                self.running += 1
+                self.peak_running = max(self.peak_running, self.running)
+            try:
+                ok = self.run_job(job)
+            except Exception:
+                ok = False
+            finally:
+                with self.lock:
+                    self.running -= 1
+                self.io_stats.end(devices)
+            if ok:
+                written = {}
+                try:
+                    written[self.write_device(job)] = os.path.getsize(job.output_file)
+                except OSError:
+                    pass
+                self.io_stats.add(read, written)
+
+            if ok:
+                job.status = 'done'
+                job.progress = 1.0
+            else:
+                job.status = 'cancelled' if self.cancelled.is_set() else 'failed'
+
+        if self.on_job_finished:
+            self.on_job_finished(job)
+        return job
+
+    def run(self, jobs):
+        """Run all jobs and block until they finish. Returns the number of successful jobs."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_jobs) as executor:
+            list(executor.map(self._run_one, jobs))
+        return sum(1 for job in jobs if job.status == 'done')
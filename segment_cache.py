@@ -0,0 +1,112 @@
+"""
+Remuxed-intermediate cache.
+
+Each source clip is remuxed once (stream copy, no re-encode) into an MPEG-TS
+segment keyed by its content hash. MPEG-TS can be concatenated at the byte
+level, so building an output becomes joining cached segments plus a single
+final remux to MP4, instead of demuxing and remuxing every clip again.
+"""
+
+import os
+import sys
+
+from app_paths import get_app_data_dir
+from disk_cache import DiskLRUCache
+from probe_cache import quick_content_hash
+
+DEFAULT_MAX_BYTES = 50 * 1024 ** 3
+
+# Longest "concat:a.ts|b.ts|..." input we pass on a command line
+MAX_PROTOCOL_ARG = 8000
+
+COPY_CHUNK = 8 * 1024 * 1024
+
+
+class SegmentCache(DiskLRUCache):
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        if cache_dir is None:
+            cache_dir = os.path.join(get_app_data_dir(), "segments")
+        super().__init__(cache_dir, max_bytes, ".ts")
+
+    def get_segment(self, clip_path, run_ffmpeg):
+        """Return the cached .ts segment for a clip, remuxing it on first use.
+        `run_ffmpeg(cmd)` runs a command and returns True on success."""
+        key = quick_content_hash(clip_path)
+        if key is None:
+            return None
+
+        def build(temp_path):
+            cmd = [
+                'ffmpeg', '-v', 'error',
+                '-i', clip_path,
+                '-map', '0:v:0', '-map', '0:a:0?',
+                '-c', 'copy',
+                '-f', 'mpegts',
+                '-y', temp_path,
+            ]
+            return run_ffmpeg(cmd)
+
+        return self.get_or_create(key, build)
+
+
+def _copy_fd(src_fd, dst_fd, size):
+    """Copy `size` bytes between file descriptors inside the kernel when possible"""
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied == size:
+                return
+        except OSError:
+            # Not supported for this filesystem pair; fall through if nothing moved yet
+            if copied:
+                raise
+
+    if sys.platform.startswith('linux') and hasattr(os, 'sendfile'):
+        while copied < size:
+            n = os.sendfile(dst_fd, src_fd, copied, min(COPY_CHUNK, size - copied))
+            if n == 0:
+                break
+            copied += n
+        if copied == size:
+            return
+
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    while copied < size:
+        data = os.read(src_fd, min(COPY_CHUNK, size - copied))
+        if not data:
+            break
+        os.write(dst_fd, data)
+        copied += len(data)
+
+
+def append_files(sources, dest_path):
+    """Byte-append `sources` into `dest_path` using copy_file_range/sendfile when available"""
+    with open(dest_path, 'wb', buffering=0) as out:
+        for src in sources:
+            with open(src, 'rb', buffering=0) as inp:
+                size = os.fstat(inp.fileno()).st_size
+                _copy_fd(inp.fileno(), out.fileno(), size)
+
+
+def choose_join_method(segments):
+    """'protocol' feeds segments straight to ffmpeg's concat: protocol (one pass);
+    'append' writes a joined .ts first, for long lists or Windows drive paths."""
+    if os.name == 'nt':
+        return 'append'
+    if sum(len(s) + 1 for s in segments) > MAX_PROTOCOL_ARG:
+        return 'append'
+    return 'protocol'
+
+
+def build_remux_command(input_url, output_file, no_audio):
+    cmd = ['ffmpeg', '-i', input_url, '-map', '0']
+    if no_audio:
+        cmd.append('-an')
+    cmd.extend(['-c', 'copy', '-y', output_file])
+    return cmd
+
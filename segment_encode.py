@@ -0,0 +1,195 @@
+"""
+Parallel segment re-encode.
+
+For outputs whose clips cannot be joined with stream copy, every clip is
+encoded on its own to one normalized profile (codec, frame size, frame rate,
+timebase, audio layout), several ffmpeg processes at a time. The encoded
+segments then share identical stream parameters and are joined with the
+usual `-c copy` concat, so a long output scales with the number of cores
+instead of running through a single encoder.
+"""
+
+import os
+import concurrent.futures
+import threading
+
+from stream_fingerprint import UNKNOWN_FINGERPRINT
+
+# ffmpeg codec name -> encoder
+VIDEO_ENCODERS = {
+    'h264': 'libx264',
+    'hevc': 'libx265',
+    'mpeg4': 'mpeg4',
+    'vp9': 'libvpx-vp9',
+    'av1': 'libaom-av1',
+}
+# ffprobe profile name -> encoder -profile:v value
+VIDEO_PROFILES = {
+    'h264': {'Baseline': 'baseline', 'Constrained Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+             'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'},
+    'hevc': {'Main': 'main', 'Main 10': 'main10'},
+}
+AUDIO_ENCODERS = {
+    'aac': 'aac',
+    'mp3': 'libmp3lame',
+    'opus': 'libopus',
+    'ac3': 'ac3',
+}
+
+
+def fps_expr(fps):
+    """ffmpeg rate for `fps`, exact for the NTSC rates (29.97 -> 30000/1001)"""
+    for base in (24, 30, 60):
+        if abs(fps - base * 1000 / 1001) < 0.01:
+            return f"{base * 1000}/1001"
+    return f"{fps:g}"
+
+
+def default_encode_workers():
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+class EncodeProfile:
+    """Target stream parameters every re-encoded segment is normalized to"""
+
+    def __init__(self, codec='h264', width=1920, height=1080, fps=30.0, timescale=15360,
+                 audio_codec='aac', sample_rate=48000, channels=2, preset='veryfast', crf=20,
+                 pix_fmt='yuv420p', video_profile=None):
+        self.codec = codec
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.timescale = timescale
+        self.audio_codec = audio_codec  # None: no audio track, like a "noaudio" fingerprint
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.preset = preset
+        self.crf = crf
+        self.pix_fmt = pix_fmt
+        self.video_profile = video_profile  # encoder -profile:v value, or None for its default
+
+    @classmethod
+    def from_fingerprint(cls, fingerprint, **overrides):
+        """Profile matching a stream fingerprint ("h264/High/yuv420p|1920x1080|30.00fps|tb15360|aac/48000/2ch"),
+        so encoded segments can also be joined with clips already in that format"""
+        profile = cls(**overrides)
+        if not fingerprint or fingerprint == UNKNOWN_FINGERPRINT:
+            return profile
+        parts = fingerprint.split('|')
+        try:
+            video, size, fps, tb, audio = parts[:5]
+            codec, video_profile, pix_fmt = (video.split('/') + ['?', '?'])[:3]
+            width, height = (int(v) for v in size.split('x'))
+            if 'codec' not in overrides and codec in VIDEO_ENCODERS:
+                profile.codec = codec
+            if pix_fmt != '?' and 'pix_fmt' not in overrides:
+                profile.pix_fmt = pix_fmt
+            if 'video_profile' not in overrides:
+                profile.video_profile = VIDEO_PROFILES.get(profile.codec, {}).get(video_profile)
+            if width > 0 and height > 0 and 'width' not in overrides and 'height' not in overrides:
+                profile.width, profile.height = width, height
+            if float(fps[:-3]) > 0 and 'fps' not in overrides:
+                profile.fps = round(float(fps[:-3]), 3)
+            if int(tb[2:]) > 0 and 'timescale' not in overrides:
+                profile.timescale = int(tb[2:])
+            if audio == 'noaudio':
+                if 'audio_codec' not in overrides:
+                    profile.audio_codec = None
+            else:
+                audio_codec, rate, channels = audio.split('/')
+                if audio_codec in AUDIO_ENCODERS and 'audio_codec' not in overrides:
+                    profile.audio_codec = audio_codec
+                if int(rate) > 0 and 'sample_rate' not in overrides:
+                    profile.sample_rate = int(rate)
+                if int(channels[:-2]) > 0 and 'channels' not in overrides:
+                    profile.channels = int(channels[:-2])
+        except ValueError:
+            pass
+        return profile
+
+    def key(self):
+        """Short string identifying the profile, e.g. for cache keys"""
+        audio = f"{self.audio_codec}{self.sample_rate}x{self.channels}" if self.audio_codec else "noaudio"
+        key = (f"{self.codec}-{self.width}x{self.height}-{self.fps:g}-tb{self.timescale}-"
+               f"{audio}-{self.preset}-crf{self.crf}")
+        # Unset or default fields are left out, so keys of such profiles are unchanged
+        if self.pix_fmt != 'yuv420p':
+            key += f"-{self.pix_fmt}"
+        if self.video_profile:
+            key += f"-{self.video_profile}"
+        return key
+
+    def video_filter(self):
+        # Fit inside the frame keeping the aspect ratio, pad the rest, fixed frame rate
+        return (f"scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+                f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps_expr(self.fps)}")
+
+    def build_command(self, clip_path, output_file, has_audio=True, no_audio=False, threads=0):
+        """ffmpeg command encoding one clip to this profile. Clips without an audio
+        track get silence, so every segment has the same streams. A profile without
+        audio drops it."""
+        no_audio = no_audio or not self.audio_codec
+        cmd = ['ffmpeg', '-v', 'error', '-i', clip_path]
+        if not no_audio and not has_audio:
+            layout = 'mono' if self.channels == 1 else 'stereo'
+            cmd.extend(['-f', 'lavfi', '-i', f"anullsrc=r={self.sample_rate}:cl={layout}"])
+
+        cmd.extend(['-map', '0:v:0', '-vf', self.video_filter(),
+                    '-c:v', VIDEO_ENCODERS.get(self.codec, 'libx264'),
+                    '-pix_fmt', self.pix_fmt,
+                    '-video_track_timescale', str(self.timescale)])
+        if self.video_profile:
+            cmd.extend(['-profile:v', self.video_profile])
+        if self.codec in ('h264', 'hevc'):
+            cmd.extend(['-preset', self.preset, '-crf', str(self.crf)])
+        if threads:
+            cmd.extend(['-threads', str(threads)])
+
+        if no_audio:
+            cmd.append('-an')
+        else:
+            cmd.extend(['-map', '0:a:0' if has_audio else '1:a:0',
+                        '-c:a', AUDIO_ENCODERS.get(self.audio_codec, 'aac'),
+                        '-ar', str(self.sample_rate), '-ac', str(self.channels)])
+            if not has_audio:
+                cmd.append('-shortest')
+
+        cmd.extend(['-y', output_file])
+        return cmd
+
+
+def encode_segments(clips, profile, segment_dir, run_ffmpeg, has_audio=None, no_audio=False,
+                    workers=None, slots=None, should_continue=None, on_segment_done=None):
+    """Encode every clip to `profile` in parallel. Returns the segment paths in clip
+    order, or None if any encode failed or `should_continue()` turned False.
+
+    `run_ffmpeg(cmd)` runs one command and returns True on success;
+    `on_segment_done(i)` is called as each segment finishes. `slots` is a
+    semaphore of `workers` encodes shared by every output rendering at once.
+    """
+    workers = workers or default_encode_workers()
+    slots = slots or threading.BoundedSemaphore(workers)
+    # Split the cores between the concurrent encoders
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    segments = [os.path.join(segment_dir, f"segment_{i:05d}.mp4") for i in range(len(clips))]
+
+    failed = []
+
+    def encode(i):
+        with slots:
+            # One failed segment fails the output; don't start the rest
+            if failed or (should_continue is not None and not should_continue()):
+                return False
+            audio = has_audio(clips[i]) if has_audio is not None else True
+            ok = run_ffmpeg(profile.build_command(clips[i], segments[i], audio, no_audio, threads))
+        if not ok:
+            failed.append(i)
+        elif on_segment_done:
+            on_segment_done(i)
+        return ok
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(encode, range(len(clips))))
+    if not all(results):
+        return None
+    return segments
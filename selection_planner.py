@@ -0,0 +1,235 @@
+"""
+Batch selection planner.
+
+Plans the clip list of every output in one pass over the library's cycle
+order. The unused clips of each compatibility bucket are laid out once with
+their prefix sums; each output's cut point is then a bisect on the prefix
+sums. If the cut overshoots the target by more than the tolerance, the last
+clip is swapped for a better fitting one from a bounded window further down
+the cycle (the swapped-out clip stays unused for the next outputs).
+"""
+
+import random
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+DEFAULT_TOLERANCE_SEC = 2.0
+
+# How far down the cycle we look for a clip that lands within tolerance
+SEARCH_WINDOW = 256
+
+
+class OutputPlan:
+    def __init__(self, index, clips, duration, fingerprints, within_tolerance=True, size=0, sources=None):
+        self.index = index
+        self.clips = clips                  # paths, in render order
+        self.sources = sources or list(clips)  # files to read: the clips or their normalized copies
+        self.duration = duration
+        self.size = size                    # bytes of the clips put together
+        self.fingerprints = fingerprints    # set of stream fingerprints used
+        self.within_tolerance = within_tolerance
+
+    @property
+    def mixed(self):
+        return len(self.fingerprints) > 1
+
+
+class BatchPlan:
+    def __init__(self, target_sec, tolerance_sec, outputs):
+        self.target_sec = target_sec
+        self.tolerance_sec = tolerance_sec
+        self.outputs = outputs
+
+    @property
+    def total_duration(self):
+        return sum(o.duration for o in self.outputs)
+
+
+class _ClipQueue:
+    """Unused clip ids (of one bucket, or all) in cycle order, with prefix sums"""
+
+    def __init__(self, ids, durations):
+        self.ids = list(ids)
+        self.durs = [durations[c] for c in self.ids]
+        self.prefix = [0.0]
+        self.prefix.extend(accumulate(self.durs))
+        self.start = 0
+
+    def remaining(self):
+        return self.prefix[-1] - self.prefix[self.start]
+
+    def empty(self):
+        return self.start >= len(self.ids)
+
+    def _swap(self, i, j):
+        self.ids[i], self.ids[j] = self.ids[j], self.ids[i]
+        self.durs[i], self.durs[j] = self.durs[j], self.durs[i]
+        for k in range(min(i, j), max(i, j) + 1):
+            self.prefix[k + 1] = self.prefix[k] + self.durs[k]
+
+    def cut(self, target, tolerance, window):
+        """Return (end, within_tolerance) so ids[start:end] best covers `target`"""
+        n = len(self.ids)
+        base = self.prefix[self.start]
+        goal = base + target
+        end = bisect_left(self.prefix, goal, lo=self.start + 1)
+        if end > n:
+            return n, False
+
+        if self.prefix[end] - goal <= tolerance:
+            return end, True
+        if end - 1 > self.start and goal - self.prefix[end - 1] <= tolerance:
+            return end - 1, True
+
+        # Swap the last clip for one from the window that lands within tolerance
+        ideal = goal - self.prefix[end - 1]
+        best = None
+        best_error = tolerance
+        for j in range(end, min(n, end + window)):
+            error = abs(self.durs[j] - ideal)
+            if error <= best_error:
+                best, best_error = j, error
+        if best is not None:
+            self._swap(end - 1, best)
+            return end, True
+        return end, False
+
+    def take(self, end):
+        ids = self.ids[self.start:end]
+        self.start = end
+        return ids
+
+
+def _eligible_buckets(library, target_sec):
+    """Buckets with enough footage for one output, or the largest one if none has"""
+    totals = {}
+    for bucket, duration in zip(library.bucket_of, library.durations):
+        totals[bucket] = totals.get(bucket, 0.0) + duration
+    totals = {b: t for b, t in totals.items() if t > 0}
+    if not totals:
+        return set()
+    if target_sec > 0:
+        eligible = {b for b, t in totals.items() if t >= target_sec}
+        if eligible:
+            return eligible
+    return {max(totals, key=totals.get)}
+
+
+def _pick_bucket(library, eligible):
+    # The next unused clip of the cycle decides, which keeps bucket choice random
+    for j in range(library.cursor, len(library.order)):
+        bucket = library.bucket_of[library.order[j]]
+        if bucket in eligible:
+            return bucket
+    return random.choice(sorted(eligible))
+
+
+def _build_queue(library, key):
+    if key is None:
+        ids = library.unused_ids()
+    else:
+        ids = [c for c in library.unused_ids() if library.bucket_of[c] == key]
+    return _ClipQueue(ids, library.durations)
+
+
+def plan_batch(video_manager, target_sec, count, tolerance_sec=DEFAULT_TOLERANCE_SEC,
+               compat_mode='strict', search_window=SEARCH_WINDOW, dry_run=False):
+    """Plan `count` outputs of `target_sec` each (0 = everything left in the cycle).
+
+    Clips are taken from the manager's cycle as they are planned, so the
+    no-repeat guarantee holds across outputs. In 'strict' mode each output
+    comes from a single compatibility bucket. With `dry_run` the cycle is
+    restored afterwards, so the plan is only a preview.
+    """
+    with video_manager.lock:
+        library = video_manager.library
+        saved = None
+        if dry_run:
+            saved = array('l', library.order), array('l', library.pos), library.cursor
+        try:
+            plan = _plan(library, target_sec, count, tolerance_sec, compat_mode, search_window)
+        finally:
+            if saved is not None:
+                library.order, library.pos, library.cursor = saved
+        # Pin the files to read while the buckets are still the ones planned from:
+        # a ClipNormalizer may move more clips into the main bucket during the render
+        for output in plan.outputs:
+            output.sources = [video_manager.source_for(path) for path in output.clips]
+        return plan
+
+
+def _plan(library, target_sec, count, tolerance_sec, compat_mode, search_window):
+    outputs = []
+    if not len(library):
+        return BatchPlan(target_sec, tolerance_sec, outputs)
+
+    if not library.unused_count():
+        library.reset_cycle()
+
+    strict = compat_mode == 'strict'
+    eligible = _eligible_buckets(library, target_sec) if strict else {None}
+    if not eligible:
+        return BatchPlan(target_sec, tolerance_sec, outputs)
+
+    queues = {}
+    for i in range(count):
+        key = _pick_bucket(library, eligible) if strict else None
+        if key not in queues:
+            queues[key] = _build_queue(library, key)
+        queue = queues[key]
+
+        clip_ids = []
+        duration = 0.0
+        within = True
+        while True:
+            if target_sec > 0:
+                end, within = queue.cut(target_sec - duration, tolerance_sec, search_window)
+            else:
+                end = len(queue.ids)
+            taken = queue.take(end)
+            library.take_ids(taken)
+            clip_ids.extend(taken)
+            duration += sum(library.durations[c] for c in taken)
+
+            if target_sec <= 0 or duration >= target_sec - tolerance_sec:
+                break
+
+            # Out of clips for this cycle: start a new cycle for the bucket
+            # (or the whole library), keeping this output's clips for last
+            if key is None:
+                library.reset_cycle()
+                queues = {}
+            elif not library.recycle_buckets({key}):
+                break
+            queue = _build_queue(library, key)
+            in_output = set(clip_ids)
+            fresh = [c for c in queue.ids if c not in in_output]
+            queue = _ClipQueue(fresh + [c for c in queue.ids if c in in_output], library.durations)
+            queues[key] = queue
+            if queue.empty():
+                break
+
+        if target_sec <= 0 and not clip_ids:
+            # "Join all" with an exhausted bucket: new cycle for it
+            if key is None:
+                library.reset_cycle()
+            else:
+                library.recycle_buckets({key})
+            queues.pop(key, None)
+            queue = queues[key] = _build_queue(library, key)
+            clip_ids = queue.take(len(queue.ids))
+            library.take_ids(clip_ids)
+            duration = sum(library.durations[c] for c in clip_ids)
+
+        fingerprints = {library.fingerprint(c) for c in clip_ids}
+        outputs.append(OutputPlan(
+            i,
+            [library.paths[c] for c in clip_ids],
+            duration,
+            fingerprints,
+            within_tolerance=within,
+            size=sum(library.sizes[c] for c in clip_ids),
+        ))
+
+    return BatchPlan(target_sec, tolerance_sec, outputs)
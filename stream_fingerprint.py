@@ -0,0 +1,132 @@
+"""
+Stream-compatibility fingerprints.
+
+Two clips can be joined with the concat demuxer and `-c copy` only if their
+streams agree on codec (with its profile and pixel format, so 8-bit and
+10-bit H.264/HEVC stay apart), frame size, frame rate, timebase and audio
+layout.
+The fingerprint is a short string built from those fields, computed from the
+probe info stored in the probe cache (either the native MP4 header parse or
+ffprobe output, normalized to the same track layout).
+"""
+
+# MP4 sample entry fourcc -> ffmpeg codec name
+CODEC_ALIASES = {
+    'avc1': 'h264',
+    'avc3': 'h264',
+    'hvc1': 'hevc',
+    'hev1': 'hevc',
+    'av01': 'av1',
+    'vp09': 'vp9',
+    'mp4v': 'mpeg4',
+    'mp4a': 'aac',
+    'ac-3': 'ac3',
+    'ec-3': 'eac3',
+    'Opus': 'opus',
+    '.mp3': 'mp3',
+}
+
+UNKNOWN_FINGERPRINT = 'unknown'
+
+
+def _codec(track):
+    if track.get('codec'):
+        return track['codec']
+    fourcc = track.get('fourcc') or ''
+    return CODEC_ALIASES.get(fourcc, fourcc.strip() or '?')
+
+
+def _fps(track):
+    if track.get('fps'):
+        return track['fps']
+    timescale = track.get('timescale') or 0
+    duration = track.get('duration') or 0
+    if not timescale or not duration or not track.get('sample_count'):
+        return 0
+    return track['sample_count'] / (duration / timescale)
+
+
+def _pix_fmt(track):
+    # Full-range JPEG variants (yuvj420p) join fine with the limited-range format
+    return (track.get('pix_fmt') or '?').replace('yuvj', 'yuv')
+
+
+def _video_track(info):
+    return next((t for t in info.get('tracks') or [] if t.get('handler') == 'vide'), None)
+
+
+def has_pixel_format(info):
+    """False for probe info cached before profiles and pixel formats were recorded"""
+    video = _video_track(info)
+    return video is None or 'pix_fmt' in video
+
+
+def compute_fingerprint(info):
+    """Return the compatibility fingerprint for a probe info dict, or UNKNOWN_FINGERPRINT.
+    Unknown profiles or pixel formats are '?', so such clips get a bucket of their own."""
+    if not info or not info.get('tracks'):
+        return UNKNOWN_FINGERPRINT
+
+    video = _video_track(info)
+    audio = next((t for t in info['tracks'] if t.get('handler') == 'soun'), None)
+    if video is None:
+        return UNKNOWN_FINGERPRINT
+
+    parts = [
+        f"{_codec(video)}/{video.get('profile') or '?'}/{_pix_fmt(video)}",
+        f"{video.get('width', 0)}x{video.get('height', 0)}",
+        f"{_fps(video):.2f}fps",
+        f"tb{video.get('timescale', 0)}",
+    ]
+    if audio is not None:
+        parts.append(f"{_codec(audio)}/{audio.get('sample_rate', 0)}/{audio.get('channels', 0)}ch")
+    else:
+        parts.append("noaudio")
+    return "|".join(parts)
+
+
+def info_from_ffprobe(data):
+    """Convert `ffprobe -of json -show_format -show_streams` output to the probe info layout"""
+    tracks = []
+    for stream in data.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type not in ('video', 'audio'):
+            continue
+        if stream.get('disposition', {}).get('attached_pic'):
+            # Cover art, not a real video stream
+            continue
+
+        time_base = stream.get('time_base', '0/1')
+        try:
+            timescale = int(time_base.split('/')[1])
+        except (IndexError, ValueError):
+            timescale = 0
+
+        fps = 0
+        rate = stream.get('avg_frame_rate') or stream.get('r_frame_rate') or '0/0'
+        try:
+            num, den = rate.split('/')
+            fps = int(num) / int(den) if int(den) else 0
+        except ValueError:
+            pass
+
+        tracks.append({
+            'handler': 'vide' if codec_type == 'video' else 'soun',
+            'codec': stream.get('codec_name', ''),
+            'timescale': timescale,
+            'width': stream.get('width', 0),
+            'height': stream.get('height', 0),
+            'fps': fps,
+            'channels': stream.get('channels', 0),
+            'sample_rate': int(stream.get('sample_rate', 0) or 0),
+            'bit_rate': int(stream.get('bit_rate', 0) or 0),
+            'profile': stream.get('profile', '') if codec_type == 'video' else '',
+            'pix_fmt': stream.get('pix_fmt', '') if codec_type == 'video' else '',
+        })
+
+    fmt = data.get('format', {})
+    return {
+        'duration': float(fmt.get('duration', 0) or 0),
+        'bit_rate': int(fmt.get('bit_rate', 0) or 0),
+        'tracks': tracks,
+    }
@@ -1,10 +1,22 @@
 import os
 import time
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QFileDialog, QCheckBox, 
-                             QProgressBar, QTextEdit, QMessageBox, QSpinBox)
+                             QProgressBar, QTextEdit, QMessageBox, QSpinBox, QLineEdit)
 from video_manager import VideoManager
-from video_joiner import VideoJoinerThread
+from video_joiner import VideoJoinerThread, LibraryScanThread, FolderWatchThread
+from render_scheduler import default_max_jobs
+from render_estimator import ThroughputModel, estimate_batch
+from segment_cache import SegmentCache
+from normalize_cache import ClipNormalizer, NormalizeCache
+from log_buffer import LogBuffer
+from batch_manifest import MANIFEST_SUFFIX, BatchManifest
+
+# Lines kept in the log view; older ones are dropped
+LOG_MAX_LINES = 5000
+# How often pending log lines are flushed into the view (ms)
+LOG_FLUSH_INTERVAL_MS = 200
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -15,8 +27,24 @@ class MainWindow(QMainWindow):
         self.video_manager = VideoManager()
         self.folder_path = ""
         self.output_folder_path = ""
+        self.scan_thread = None
+        self.watch_thread = None
+        # Learns this machine's render speed from finished batches
+        self.throughput_model = ThroughputModel()
+        self.segment_cache = None
+        self.normalize_cache = None
+        self.normalizer = None
+        self.log_buffer = LogBuffer(max_history=LOG_MAX_LINES)
+        self.completed_outputs = 0
+        self.is_scanning = False
+        self.is_rendering = False
         
         self.init_ui()
+
+        # Worker threads write into log_buffer; the view is updated in batches
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(LOG_FLUSH_INTERVAL_MS)
         
     def init_ui(self):
         central_widget = QWidget()
@@ -31,6 +59,16 @@ class MainWindow(QMainWindow):
         folder_layout.addWidget(self.btn_select_folder)
         folder_layout.addWidget(self.folder_label)
         layout.addLayout(folder_layout)
+
+        # Scan options
+        scan_layout = QHBoxLayout()
+        self.chk_recursive = QCheckBox("Include subfolders")
+        scan_layout.addWidget(self.chk_recursive)
+        scan_layout.addWidget(QLabel("Extensions:"))
+        self.txt_extensions = QLineEdit(".mp4")
+        self.txt_extensions.setToolTip("Comma separated, e.g. .mp4, .mov")
+        scan_layout.addWidget(self.txt_extensions)
+        layout.addLayout(scan_layout)
         
         # Output Folder Selection
         output_layout = QHBoxLayout()
@@ -45,6 +83,27 @@ class MainWindow(QMainWindow):
         controls_layout = QHBoxLayout()
         self.chk_no_audio = QCheckBox("Xuất video không có âm thanh (Mute)")
         controls_layout.addWidget(self.chk_no_audio)
+
+        self.chk_compat = QCheckBox("Only join compatible clips")
+        self.chk_compat.setChecked(True)
+        self.chk_compat.setToolTip("Each output uses clips with the same codec, resolution, fps and audio layout")
+        controls_layout.addWidget(self.chk_compat)
+
+        self.chk_segment_cache = QCheckBox("Use remux cache")
+        self.chk_segment_cache.setToolTip("Remux each clip once into a cached segment; later outputs just join segments")
+        controls_layout.addWidget(self.chk_segment_cache)
+
+        self.chk_reencode = QCheckBox("Re-encode (fix lag)")
+        self.chk_reencode.setToolTip("Encode every clip to one format in parallel, then join; slower but works for any mix of clips")
+        controls_layout.addWidget(self.chk_reencode)
+
+        self.chk_normalize = QCheckBox("Normalize odd clips")
+        self.chk_normalize.setToolTip("After loading, convert clips in other formats to the main format in the background (cached)")
+        controls_layout.addWidget(self.chk_normalize)
+
+        self.chk_watch = QCheckBox("Watch folder")
+        self.chk_watch.setToolTip("Add new clips (and drop deleted ones) while the app is open, without rescanning")
+        controls_layout.addWidget(self.chk_watch)
         
         # Target Duration Input
         self.spin_duration = QSpinBox()
@@ -53,6 +112,7 @@ class MainWindow(QMainWindow):
         self.spin_duration.setSuffix(" min")
         self.spin_duration.setToolTip("Set 0 to join all available videos")
         self.spin_duration.valueChanged.connect(self.update_duration_display)
+        self.spin_duration.valueChanged.connect(self.update_render_enabled)
         controls_layout.addWidget(QLabel("Target Duration:"))
         controls_layout.addWidget(self.spin_duration)
         
@@ -69,12 +129,43 @@ class MainWindow(QMainWindow):
         self.spin_video_count.setToolTip("Number of videos to export")
         controls_layout.addWidget(QLabel("Number of Videos:"))
         controls_layout.addWidget(self.spin_video_count)
+
+        # Number of outputs rendered at the same time
+        self.spin_jobs = QSpinBox()
+        self.spin_jobs.setRange(1, max(1, os.cpu_count() or 1))
+        self.spin_jobs.setValue(default_max_jobs())
+        self.spin_jobs.setToolTip("Number of videos rendered in parallel")
+        controls_layout.addWidget(QLabel("Parallel Jobs:"))
+        controls_layout.addWidget(self.spin_jobs)
+
+        # Jobs reading from or writing to the same disk at once (caps Parallel Jobs on one disk)
+        self.spin_jobs_per_device = QSpinBox()
+        self.spin_jobs_per_device.setRange(1, max(1, os.cpu_count() or 1))
+        self.spin_jobs_per_device.setValue(2)
+        self.spin_jobs_per_device.setToolTip("Videos rendered at once from or to the same disk; "
+                                             "raise it for SSDs, lower it for slow HDDs or NAS shares")
+        controls_layout.addWidget(QLabel("Per Disk:"))
+        controls_layout.addWidget(self.spin_jobs_per_device)
         
         layout.addLayout(controls_layout)
+
+        # Predicted size and run time of the current settings (nothing is rendered)
+        self.btn_estimate = QPushButton("Estimate Time && Size")
+        self.btn_estimate.clicked.connect(self.show_estimate)
+        self.btn_estimate.setEnabled(False)
+        layout.addWidget(self.btn_estimate)
+        self.lbl_estimate = QLabel("")
+        self.lbl_estimate.setWordWrap(True)
+        layout.addWidget(self.lbl_estimate)
         
         self.btn_join = QPushButton("Render Videos")
         self.btn_join.clicked.connect(self.start_joining)
         layout.addWidget(self.btn_join)
+
+        # Finish a crashed or cancelled batch from its manifest
+        self.btn_resume = QPushButton("Resume Batch...")
+        self.btn_resume.clicked.connect(self.resume_batch)
+        layout.addWidget(self.btn_resume)
         
         self.btn_cancel = QPushButton("Cancel / Stop")
         self.btn_cancel.clicked.connect(self.cancel_joining)
@@ -84,9 +175,15 @@ class MainWindow(QMainWindow):
         # Progress and Log
         self.progress_bar = QProgressBar()
         layout.addWidget(self.progress_bar)
+
+        # Progress of the outputs currently rendering
+        self.job_progress = {}
+        self.lbl_job_progress = QLabel("")
+        layout.addWidget(self.lbl_job_progress)
         
         self.log_text = QTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.document().setMaximumBlockCount(LOG_MAX_LINES)
         layout.addWidget(self.log_text)
         
     def select_folder(self):
@@ -95,13 +192,112 @@ class MainWindow(QMainWindow):
             self.folder_path = folder
             self.folder_label.setText(folder)
             self.log(f"Loading videos from {folder}...")
-            # Use QApplication.processEvents() to show the log immediately if needed, 
-            # but since load_videos is blocking (though parallelized), UI might freeze briefly.
-            # For 1000s of videos, parallelization helps significantly.
-            count = self.video_manager.load_videos(folder)
-            
-            self.log(f"Loaded {count} videos.")
-            self.btn_join.setEnabled(count > 0)
+
+            self.stop_scan()
+            self.stop_normalizer()
+            self.stop_watcher()
+
+            # Scan in the background; clips become usable batch by batch
+            self.is_scanning = True
+            self.btn_join.setEnabled(False)
+            self.scan_thread = LibraryScanThread(
+                self.video_manager, folder,
+                extensions=self.txt_extensions.text(),
+                recursive=self.chk_recursive.isChecked(),
+            )
+            self.scan_thread.batch_signal.connect(self.on_scan_batch)
+            self.scan_thread.finished_signal.connect(self.on_scan_finished)
+            self.scan_thread.start()
+
+    def stop_scan(self):
+        if self.scan_thread is not None:
+            # Signals it already queued must not reach the next scan's handlers
+            self.scan_thread.batch_signal.disconnect(self.on_scan_batch)
+            self.scan_thread.finished_signal.disconnect(self.on_scan_finished)
+            self.scan_thread.stop()
+            self.scan_thread.wait()
+
+    def on_scan_batch(self, count, total_duration):
+        if self.sender() is not self.scan_thread:
+            return
+        self.folder_label.setText(f"{self.folder_path} ({count} videos, {total_duration / 60:.1f} min)")
+        self.update_render_enabled()
+
+    def on_scan_finished(self, count):
+        if self.sender() is not self.scan_thread:
+            return
+        self.is_scanning = False
+        self.log(f"Loaded {count} videos.")
+        failures = self.video_manager.describe_probe_failures()
+        if failures:
+            self.log(failures)
+        buckets = self.video_manager.bucket_durations()
+        if len(buckets) > 1:
+            self.log(f"Found {len(buckets)} stream formats:")
+            for fp, total in sorted(buckets.items(), key=lambda item: -item[1]):
+                self.log(f"  {fp}: {total / 60:.1f} min")
+            if self.chk_normalize.isChecked():
+                self.start_normalizer()
+        if self.chk_watch.isChecked() and self.scan_thread is not None and self.scan_thread.scanner.is_running:
+            self.start_watcher()
+        self.update_render_enabled()
+
+    def start_watcher(self):
+        self.stop_watcher()
+        scanner = self.scan_thread.scanner
+        self.watch_thread = FolderWatchThread(self.video_manager, scanner.folders,
+                                              extensions=scanner.extensions,
+                                              recursive=scanner.recursive,
+                                              log_buffer=self.log_buffer)
+        self.watch_thread.changed_signal.connect(self.on_library_changed)
+        self.watch_thread.start()
+
+    def stop_watcher(self):
+        if self.watch_thread is not None:
+            self.watch_thread.stop()
+            self.watch_thread.wait()
+            self.watch_thread = None
+
+    def on_library_changed(self, added, removed, count):
+        self.folder_label.setText(f"{self.folder_path} ({count} videos, {self.video_manager.total_duration() / 60:.1f} min)")
+        self.update_render_enabled()
+
+    def closeEvent(self, event):
+        # Let a running batch stop its ffmpeg processes and leave a resumable manifest
+        if hasattr(self, 'thread') and self.thread.isRunning():
+            self.thread.stop()
+            self.thread.wait()
+        self.stop_scan()
+        self.stop_watcher()
+        self.stop_normalizer()
+        super().closeEvent(event)
+
+    def start_normalizer(self):
+        if self.normalize_cache is None:
+            self.normalize_cache = NormalizeCache()
+        # Logs go straight into the buffer; the normalizer runs on its own thread
+        self.normalizer = ClipNormalizer(self.video_manager, self.normalize_cache, on_log=self.log_buffer.append)
+        self.normalizer.start()
+
+    def stop_normalizer(self):
+        if self.normalizer is not None:
+            self.normalizer.stop()
+            self.normalizer = None
+
+    def update_render_enabled(self):
+        """Allow rendering once enough probed duration exists for one output"""
+        if self.is_rendering:
+            return
+        target_sec = self.spin_duration.value() * 60
+        if not self.video_manager.all_videos:
+            ready = False
+        elif self.is_scanning:
+            # "Join all" needs the whole library; a fixed target only needs enough footage
+            ready = target_sec > 0 and self.video_manager.total_duration() >= target_sec
+        else:
+            ready = True
+        self.btn_join.setEnabled(ready)
+        self.btn_estimate.setEnabled(ready)
 
     def select_output_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Output Folder")
@@ -131,7 +327,13 @@ class MainWindow(QMainWindow):
                 self.lbl_duration_display.setText(f"({remaining_mins}p)")
 
     def log(self, message):
-        self.log_text.append(message)
+        self.log_buffer.append(message)
+
+    def flush_log(self):
+        messages = self.log_buffer.drain()
+        if not messages:
+            return
+        self.log_text.append("\n".join(messages))
         # Scroll to bottom
         sb = self.log_text.verticalScrollBar()
         sb.setValue(sb.maximum())
@@ -141,20 +343,16 @@ class MainWindow(QMainWindow):
             return
             
         # Check if we have unused videos.
-        if not self.video_manager.unused_videos:
+        if not self.video_manager.unused_count():
             self.video_manager.reset_cycle()
             
         target_duration_sec = self.spin_duration.value() * 60  # Convert minutes to seconds
         no_audio = self.chk_no_audio.isChecked()
         video_count = self.spin_video_count.value()
         
-        # Determine output folder
-        base_out_folder = self.output_folder_path if self.output_folder_path else self.folder_path
-        if not base_out_folder:
-            base_out_folder = self.folder_path
-            
         # Create 'Output' subfolder
-        out_folder = os.path.join(base_out_folder, "Output")
+        out_folder = self.get_output_folder()
+        base_out_folder = os.path.dirname(out_folder)
         if not os.path.exists(out_folder):
             try:
                 os.makedirs(out_folder)
@@ -162,17 +360,117 @@ class MainWindow(QMainWindow):
                 self.log(f"Error creating Output folder: {e}")
                 out_folder = base_out_folder # Fallback
         
+        self.thread = VideoJoinerThread(self.video_manager, target_duration_sec, no_audio, out_folder, video_count,
+                                        max_jobs=self.spin_jobs.value(),
+                                        jobs_per_device=self.spin_jobs_per_device.value(),
+                                        compat_mode='strict' if self.chk_compat.isChecked() else 'flag',
+                                        segment_cache=self.get_segment_cache(),
+                                        encode_mode='always' if self.chk_reencode.isChecked() else 'copy',
+                                        normalize_cache=self.normalize_cache,
+                                        throughput_model=self.throughput_model,
+                                        log_buffer=self.log_buffer)
+        self.start_thread(video_count)
+
+    def get_output_folder(self):
+        base_out_folder = self.output_folder_path if self.output_folder_path else self.folder_path
+        return os.path.join(base_out_folder, "Output")
+
+    def show_estimate(self):
+        estimate = estimate_batch(self.video_manager, self.spin_duration.value() * 60,
+                                  self.spin_video_count.value(),
+                                  model=self.throughput_model,
+                                  encode_mode='always' if self.chk_reencode.isChecked() else 'copy',
+                                  max_jobs=self.spin_jobs.value(),
+                                  jobs_per_device=self.spin_jobs_per_device.value(),
+                                  output_folder=self.get_output_folder(),
+                                  compat_mode='strict' if self.chk_compat.isChecked() else 'flag')
+        if not estimate.outputs:
+            self.lbl_estimate.setText("No videos to plan.")
+            return
+        self.lbl_estimate.setText(estimate.summary())
+        self.lbl_estimate.setStyleSheet("" if estimate.fits else "color: #dc2626;")
+
+    def resume_batch(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Select Batch Manifest", self.output_folder_path or self.folder_path,
+                                              f"Batch manifest (*{MANIFEST_SUFFIX})")
+        if not path:
+            return
+        try:
+            manifest = BatchManifest.load(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Cannot read manifest: {e}")
+            return
+
+        done, total = manifest.counts()
+        if done == total:
+            QMessageBox.information(self, "Resume", "All outputs of this batch are already done.")
+            return
+
+        settings = manifest.settings
+        self.thread = VideoJoinerThread(self.video_manager, settings.get('target_duration_sec', 0),
+                                        settings.get('no_audio', False),
+                                        settings.get('output_folder') or os.path.dirname(path),
+                                        total - done,
+                                        max_jobs=self.spin_jobs.value(),
+                                        jobs_per_device=self.spin_jobs_per_device.value(),
+                                        segment_cache=self.get_segment_cache(),
+                                        encode_mode=settings.get('encode_mode', 'copy'),
+                                        encode_profile=settings.get('encode_profile'),
+                                        encode_workers=settings.get('encode_workers'),
+                                        log_buffer=self.log_buffer,
+                                        throughput_model=self.throughput_model,
+                                        manifest=manifest)
+        self.start_thread(total - done)
+
+    def get_segment_cache(self):
+        if not self.chk_segment_cache.isChecked():
+            return None
+        if self.segment_cache is None:
+            self.segment_cache = SegmentCache()
+        return self.segment_cache
+
+    def start_thread(self, video_count):
+        self.is_rendering = True
         self.btn_join.setEnabled(False)
+        self.btn_resume.setEnabled(False)
         self.btn_cancel.setEnabled(True)
-        self.progress_bar.setRange(0, video_count)
+        # Hundredths of an output, so partial progress of running outputs shows up
+        self.progress_bar.setRange(0, video_count * 100)
         self.progress_bar.setValue(0)
-        
-        self.thread = VideoJoinerThread(self.video_manager, target_duration_sec, no_audio, out_folder, video_count)
+        self.completed_outputs = 0
+        self.job_progress = {}
+        self.lbl_job_progress.setText("")
+
         self.thread.log_signal.connect(self.log)
-        self.thread.progress_signal.connect(self.progress_bar.setValue)
+        self.thread.progress_signal.connect(self.update_completed)
+        self.thread.job_progress_signal.connect(self.update_job_progress)
         self.thread.finished_signal.connect(self.on_finished)
         self.thread.start()
         
+    def update_completed(self, completed):
+        self.completed_outputs = completed
+        self.refresh_progress()
+
+    def update_job_progress(self, index, fraction, eta):
+        if fraction >= 1.0:
+            self.job_progress.pop(index, None)
+        else:
+            self.job_progress[index] = (fraction, eta)
+        self.refresh_progress()
+
+    def refresh_progress(self):
+        running = sum(fraction for fraction, _ in self.job_progress.values())
+        self.progress_bar.setValue(int((self.completed_outputs + running) * 100))
+
+        parts = []
+        for i, (fraction, eta) in sorted(self.job_progress.items()):
+            text = f"#{i+1}: {fraction*100:.0f}%"
+            if eta >= 0:
+                minutes, seconds = divmod(int(eta), 60)
+                text += f" (ETA {minutes}:{seconds:02d})"
+            parts.append(text)
+        self.lbl_job_progress.setText("  ".join(parts))
+
     def cancel_joining(self):
         if hasattr(self, 'thread') and self.thread.isRunning():
             self.thread.stop()
@@ -180,11 +478,16 @@ class MainWindow(QMainWindow):
             self.btn_cancel.setEnabled(False)
             
     def on_finished(self, success, message):
-        self.btn_join.setEnabled(True)
+        self.flush_log()
+        self.is_rendering = False
+        self.job_progress = {}
+        self.lbl_job_progress.setText("")
         self.btn_cancel.setEnabled(False)
+        self.btn_resume.setEnabled(True)
+        self.update_render_enabled()
         if success:
             QMessageBox.information(self, "Thành công", f"Đã xuất thành công {message} video(s)!")
-            self.log(f"Cycle Status: {len(self.video_manager.unused_videos)} unused, {len(self.video_manager.used_videos)} used.")
+            self.log(f"Cycle Status: {self.video_manager.unused_count()} unused, {self.video_manager.used_count()} used.")
         else:
             if "terminated" in message or "stopped" in message.lower():
                  QMessageBox.warning(self, "Cancelled", "Process was cancelled by user.")
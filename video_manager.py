@@ -1,86 +1,401 @@
 import os
-import random
-import subprocess
-import concurrent.futures
+import time
+import hashlib
+import threading
+
+from app_paths import get_app_data_dir
+from clip_library import ClipLibrary, path_key
+from library_scanner import DEFAULT_EXTENSIONS, iter_video_files, normalize_extensions
+from probe_cache import ProbeCache, file_signature, quick_content_hash
+from metrics import Metrics
+from probe_engine import PERMANENT, ProbeEngine, ProbeResult
+from stream_fingerprint import UNKNOWN_FINGERPRINT, compute_fingerprint, has_pixel_format
 
 class VideoManager:
-    def __init__(self):
-        self.all_videos = []
-        self.unused_videos = []
-        self.used_videos = []
-        self.durations = {} # Cache for video durations
-
-    def load_videos(self, folder_path):
-        self.all_videos = []
-        self.unused_videos = []
-        self.used_videos = []
-        self.durations = {}
+    def __init__(self, probe_cache=None, use_content_hash=True, persist_cycle=True, probe_engine=None):
+        self.library = ClipLibrary()
+        self.use_content_hash = use_content_hash
+        # Scans and renders can run at the same time, so guard the cycle state
+        self.lock = threading.RLock()
+
+        # Cycle state is saved per set of input folders so clips don't repeat across sessions
+        self.persist_cycle = persist_cycle
+        self.state_path = None
+        self.restored_used = set()
+
+        # What the library was loaded from (recorded in batch manifests for resuming)
+        self.folders = []
+        self.extensions = DEFAULT_EXTENSIONS
+        self.recursive = False
+
+        # path -> (normalized copy, original fingerprint) for clips moved into
+        # the main bucket by a ClipNormalizer
+        self.normalized = {}
+
+        # Scan/probe timings and counters (see metrics.Metrics)
+        self.metrics = Metrics()
+
+        # Files of the current library that could not be probed: path -> ProbeResult
+        self.probe_engine = probe_engine or ProbeEngine()
+        self.probe_failures = {}
+
+        # Persistent probe results shared across runs
+        self.probe_cache = probe_cache
+        if self.probe_cache is None:
+            try:
+                self.probe_cache = ProbeCache()
+            except Exception as e:
+                print(f"Probe cache disabled: {e}")
+
+    @property
+    def all_videos(self):
+        return self.library.paths
+
+    @property
+    def unused_videos(self):
+        """Paths left in the current cycle (builds a list; prefer unused_count())"""
+        with self.lock:
+            return [self.library.paths[c] for c in self.library.unused_ids()]
+
+    @property
+    def used_videos(self):
+        """Paths already used in the current cycle (builds a list)"""
+        with self.lock:
+            return [self.library.paths[c] for c in self.library.used_ids()]
+
+    def load_videos(self, folder_path, extensions=DEFAULT_EXTENSIONS, recursive=False):
+        """Load every video in a folder (or a list of folders) and continue its saved cycle"""
+        folders = [folder_path] if isinstance(folder_path, str) else list(folder_path)
+        extensions = normalize_extensions(extensions)
+        self.begin_load(folders, extensions, recursive)
         
         try:
-            files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith('.mp4')]
-            self.all_videos = files
+            signatures = {}
+            with self.metrics.timer('scan'):
+                for folder in folders:
+                    signatures.update(iter_video_files(folder, extensions, recursive))
+            self.metrics.incr('scan_files', len(signatures))
             
-            # Pre-fetch durations in parallel
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                # We map the get_duration function to all files
-                # We don't strictly need the results right now, but this populates the cache
-                list(executor.map(self.get_duration, self.all_videos))
-
-            # Initial shuffle
-            self.reset_cycle()
-            return len(self.all_videos)
+            # Only new or changed files need to be probed
+            self.add_videos(signatures)
+            self.evict_missing()
+            return len(self.library)
         except Exception as e:
             print(f"Error loading videos: {e}")
             return 0
 
-    def reset_cycle(self):
-        self.unused_videos = list(self.all_videos)
-        random.shuffle(self.unused_videos)
-        self.used_videos = []
+    def begin_load(self, folders=None, extensions=DEFAULT_EXTENSIONS, recursive=False):
+        """Forget the current library before a (possibly incremental) scan of `folders`"""
+        with self.lock:
+            self.folders = list(folders or [])
+            self.extensions = normalize_extensions(extensions)
+            self.recursive = recursive
+            self.library = ClipLibrary()
+            self.normalized = {}
+            self.probe_failures = {}
+            self.state_path = None
+            self.restored_used = set()
+            if self.persist_cycle and folders:
+                self.state_path = self._state_path_for(folders)
+                self.restored_used = ClipLibrary.load_state(self.state_path)
+
+    def evict_missing(self):
+        """After a complete scan: forget cached probes of files gone from the loaded folders"""
+        if self.probe_cache is None or not self.folders:
+            return 0
+        removed = self.probe_cache.evict_stale(folders=self.folders)
+        self.metrics.incr('probe_cache_evicted', removed)
+        return removed
+
+    @staticmethod
+    def _folders_key(folders):
+        return "\n".join(sorted(os.path.normcase(os.path.abspath(f)) for f in folders))
+
+    def is_loaded_from(self, folders):
+        """True if the library was loaded from exactly these folders"""
+        return bool(self.folders) and self._folders_key(self.folders) == self._folders_key(folders)
+
+    @staticmethod
+    def _state_path_for(folders):
+        key = VideoManager._folders_key(folders)
+        state_dir = os.path.join(get_app_data_dir(), "cycles")
+        os.makedirs(state_dir, exist_ok=True)
+        return os.path.join(state_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".state")
+
+    def save_cycle_state(self):
+        if self.state_path is None:
+            return
+        with self.lock:
+            try:
+                self.library.save_state(self.state_path)
+            except OSError as e:
+                print(f"Could not save cycle state: {e}")
+
+    def add_videos(self, signatures):
+        """Probe a batch of files (path -> (size, mtime)) and add the valid ones to the
+        library and the current cycle. Returns the list of added paths."""
+        results = self._load_durations(signatures)
+        added = []
+        with self.lock:
+            for path in signatures:
+                if path not in results or path in self.library.ids:
+                    continue
+                duration, fingerprint = results[path]
+                if duration <= 0:
+                    continue
+                used = bool(self.restored_used) and path_key(path) in self.restored_used
+                self.library.add(path, duration, fingerprint, used=used, size=signatures[path][0])
+                added.append(path)
+        return added
+
+    def remove_videos(self, paths):
+        """Drop deleted clips from the library and the cycle. Returns how many were removed."""
+        removed = 0
+        with self.lock:
+            for path in paths:
+                if self.library.remove(path):
+                    self.normalized.pop(path, None)
+                    removed += 1
+        return removed
+
+    def update_videos(self, signatures):
+        """Add new clips and re-probe changed ones (path -> (size, mtime)), keeping the
+        cycle position of clips that were already used. Returns the list of added paths."""
+        used_keys = set()
+        with self.lock:
+            for path in signatures:
+                clip_id = self.library.ids.get(path)
+                if clip_id is None:
+                    continue
+                if self.library.pos[clip_id] < self.library.cursor:
+                    used_keys.add(path_key(path))
+                self.library.remove(path)
+                self.normalized.pop(path, None)
+            used_keys -= self.restored_used
+            self.restored_used |= used_keys
+        try:
+            # Probing happens outside the lock so renders and planning are not held up
+            return self.add_videos(signatures)
+        finally:
+            with self.lock:
+                self.restored_used -= used_keys
+
+    def release_videos(self, paths):
+        """Return clips that were planned but never rendered to the unused part of the
+        cycle. Returns how many were released."""
+        with self.lock:
+            ids = [self.library.ids[p] for p in paths if p in self.library.ids]
+            released = self.library.release(ids)
+        if released:
+            self.save_cycle_state()
+        return released
+
+    def claim_videos(self, paths):
+        """Mark clips as used in this cycle (e.g. the clips of a resumed batch)"""
+        with self.lock:
+            self.library.take_ids([self.library.ids[p] for p in paths if p in self.library.ids])
+        self.save_cycle_state()
+
+    def total_duration(self):
+        with self.lock:
+            return sum(self.library.durations)
+
+    def _load_durations(self, signatures):
+        """Return path -> (duration, fingerprint) for the files that could be probed.
+        The others are recorded in probe_failures."""
+        start = time.perf_counter()
+        results = {}
+        failures = {}
+        if self.probe_cache is not None:
+            for path, entry in self.probe_cache.get_many(signatures).items():
+                info = entry['info']
+                # Entries from before stream info (or pixel formats) was recorded need one more probe
+                if not info or not has_pixel_format(info):
+                    continue
+                if 'error' in info:
+                    # Failed before and unchanged since: don't probe it again
+                    failures[path] = ProbeResult(path, source='cache', error=info['error'],
+                                                 detail=info.get('detail', ''))
+                    continue
+                results[path] = (entry['duration'], compute_fingerprint(info))
+        self.metrics.incr('probe_cache_hits', len(results) + len(failures))
+
+        missing = [p for p in signatures if p not in results and p not in failures]
+        to_store = []
+
+        # Renamed or moved clips can be matched by content instead of re-probed. Only files
+        # the size of a cached entry are hashed, so a cold cache reads nothing extra.
+        hashes = {}
+        if self.probe_cache is not None and self.use_content_hash and missing:
+            candidates = self.probe_cache.get_by_sizes({signatures[p][0] for p in missing})
+            for path in missing:
+                size, mtime = signatures[path]
+                usable = [e for e in candidates.get(size, [])
+                          if e['info'] and 'error' not in e['info'] and has_pixel_format(e['info'])]
+                if not usable:
+                    continue
+                content_hash = quick_content_hash(path, size)
+                hashes[path] = content_hash
+                entry = next((e for e in usable if content_hash and e['content_hash'] == content_hash), None)
+                if entry is None:
+                    # Stored without a hash: a moved or renamed file keeps its size and mtime
+                    entry = next((e for e in usable if not e['content_hash'] and e['mtime'] == mtime), None)
+                if entry is not None:
+                    results[path] = (entry['duration'], compute_fingerprint(entry['info']))
+                    to_store.append((path, size, mtime, entry['duration'], content_hash, entry['info']))
+            matched = len(missing)
+            missing = [p for p in missing if p not in results]
+            self.metrics.incr('probe_hash_hits', matched - len(missing))
+        self.metrics.incr('probe_cache_misses', len(missing))
 
-    def get_next_video(self):
-        if not self.all_videos:
+        # Probe the rest concurrently
+        for path, result in self.probe_engine.probe_many(missing).items():
+            self.metrics.incr(f'probe_{result.source}')
+            if result.attempts > 1:
+                self.metrics.incr('probe_retries', result.attempts - 1)
+            if result.ok:
+                results[path] = (result.duration, compute_fingerprint(result.info))
+                to_store.append((path, *signatures[path], result.duration, hashes.get(path), result.info))
+                continue
+            failures[path] = result
+            if result.error in PERMANENT:
+                # Cached as a failure so the file is skipped until it changes
+                to_store.append((path, *signatures[path], 0.0, None,
+                                 {'error': result.error, 'detail': result.detail}))
+
+        for result in failures.values():
+            self.metrics.incr('probe_failures')
+            self.metrics.incr(f'probe_failed_{result.error}')
+        with self.lock:
+            self.probe_failures.update(failures)
+
+        if self.probe_cache is not None and to_store:
+            self.probe_cache.put_many(to_store)
+        self.metrics.observe('probe', time.perf_counter() - start)
+        return results
+
+    def describe_probe_failures(self):
+        """One line about the files that could not be probed, or None if there are none"""
+        with self.lock:
+            failures = list(self.probe_failures.values())
+        if not failures:
             return None
-        
-        if not self.unused_videos:
-            self.reset_cycle()
+        reasons = {}
+        for result in failures:
+            reasons[result.error] = reasons.get(result.error, 0) + 1
+        counts = ", ".join(f"{n} {reason}" for reason, n in sorted(reasons.items(), key=lambda item: -item[1]))
+        return f"Skipped {len(failures)} file(s) that could not be probed ({counts})"
+
+    def get_fingerprint(self, file_path):
+        clip_id = self.library.ids.get(file_path)
+        if clip_id is None:
+            return UNKNOWN_FINGERPRINT
+        return self.library.fingerprint(clip_id)
+
+    def _bucket_set(self, fingerprints):
+        return {self.library.bucket_ids[fp] for fp in fingerprints if fp in self.library.bucket_ids}
+
+    def get_buckets(self):
+        """Group the library into stream-compatible buckets: fingerprint -> list of paths"""
+        buckets = {}
+        with self.lock:
+            for clip_id, path in enumerate(self.library.paths):
+                buckets.setdefault(self.library.fingerprint(clip_id), []).append(path)
+        return buckets
+
+    def bucket_durations(self):
+        """Total probed duration per fingerprint"""
+        with self.lock:
+            totals = [0.0] * len(self.library.bucket_names)
+            for bucket, duration in zip(self.library.bucket_of, self.library.durations):
+                totals[bucket] += duration
+            return dict(zip(self.library.bucket_names, totals))
+
+    def target_fingerprint(self):
+        """The main stream format: the bucket with the most footage (None if nothing is known)"""
+        totals = {fp: t for fp, t in self.bucket_durations().items() if fp != UNKNOWN_FINGERPRINT and t > 0}
+        if not totals:
+            return None
+        return max(totals, key=totals.get)
+
+    def clips_outside(self, fingerprint):
+        """(path, fingerprint) of the clips in other buckets than `fingerprint`"""
+        with self.lock:
+            library = self.library
+            return [(path, library.fingerprint(clip_id)) for clip_id, path in enumerate(library.paths)
+                    if library.fingerprint(clip_id) != fingerprint]
+
+    def mark_normalized(self, file_path, normalized_path, fingerprint):
+        """Use `normalized_path` when rendering `file_path`, which now has `fingerprint`"""
+        with self.lock:
+            clip_id = self.library.ids.get(file_path)
+            if clip_id is None:
+                return
+            original = self.normalized.get(file_path, (None, self.library.fingerprint(clip_id)))[1]
+            self.normalized[file_path] = (normalized_path, original)
+            self.library.set_bucket(clip_id, fingerprint)
+
+    def source_for(self, file_path):
+        """The file to actually read for a clip: its normalized copy if there is one"""
+        entry = self.normalized.get(file_path)
+        return entry[0] if entry is not None else file_path
+
+    def unused_count(self, fingerprints=None):
+        """Number of clips left in the current cycle, optionally only from some buckets"""
+        with self.lock:
+            if fingerprints is None:
+                return self.library.unused_count()
+            return self.library.unused_count(self._bucket_set(fingerprints))
+
+    def used_count(self):
+        return self.library.cursor
+
+    def reset_cycle(self):
+        with self.lock:
+            self.library.reset_cycle()
+            self.restored_used = set()
+        self.save_cycle_state()
+
+    def get_next_video(self, fingerprints=None):
+        """Take the next clip of the cycle. If `fingerprints` is given, only clips from
+        those compatibility buckets are considered."""
+        with self.lock:
+            if not len(self.library):
+                return None
             
-        if self.unused_videos:
-            video = self.unused_videos.pop()
-            self.used_videos.append(video)
-            return video
-        return None
+            if not self.library.unused_count():
+                self.reset_cycle()
+
+            buckets = None if fingerprints is None else self._bucket_set(fingerprints)
+            clip_id = self.library.take_next(buckets)
+            if clip_id is None and buckets:
+                # The buckets are used up for this cycle: start a new cycle for
+                # them only, so other clips still don't repeat before their turn
+                if self.library.recycle_buckets(buckets):
+                    clip_id = self.library.take_next(buckets)
+            if clip_id is None:
+                return None
+            return self.library.paths[clip_id]
         
     def get_duration(self, file_path):
-        if file_path in self.durations:
-            return self.durations[file_path]
-            
-        try:
-            cmd = [
-                'ffprobe', 
-                '-v', 'error', 
-                '-show_entries', 'format=duration', 
-                '-of', 'default=noprint_wrappers=1:nokey=1', 
-                file_path
-            ]
-            # Add timeout to prevent hanging
-            # Use creationflags=subprocess.CREATE_NO_WINDOW on Windows to avoid popping up consoles if not already handled
-            startupinfo = None
-            if os.name == 'nt':
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                
-            result = subprocess.run(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True, 
-                timeout=5,
-                startupinfo=startupinfo
-            )
-            duration = float(result.stdout.strip())
-            self.durations[file_path] = duration
-            return duration
-        except Exception as e:
-            # print(f"Error getting duration for {os.path.basename(file_path)}: {e}")
+        clip_id = self.library.ids.get(file_path)
+        if clip_id is not None:
+            return self.library.durations[clip_id]
+
+        sig = file_signature(file_path)
+        if sig is None:
+            return 0
+
+        entry = self.probe_cache.get(file_path, *sig) if self.probe_cache is not None else None
+        if entry is not None and entry['info'] and 'error' not in entry['info']:
+            return entry['duration']
+        if entry is not None and 'error' in entry['info']:
             return 0
+
+        result = self.probe_engine.probe(file_path)
+        if not result.ok:
+            return 0
+
+        if self.probe_cache is not None:
+            self.probe_cache.put(file_path, *sig, result.duration, info=result.info)
+        return result.duration